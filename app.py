@@ -1,12 +1,38 @@
+import copy
 import json
 import pathlib
 import uuid
 
-import numpy as np
+import startup
+
+startup.begin()  # no-op unless URBAN_PERF_STARTUP_PROFILE is set
+
 import streamlit as st
-from plotly import graph_objects as go
 from functools import partial
 
+import chart_transport
+import geodata
+import telemetry
+import viewer_assets
+from downsample import lttb
+from model import (
+    CATEGORIES,
+    CITY_DATA,
+    INTERVENTIONS,
+    TARGET_YEAR,
+    YEARS,
+    candidate_cities,
+    category_improvement_from_kpis,
+    find_city,
+    improve_kpis,
+    mobility_lifts,
+    project_category_indices,
+)
+from prefetch import CityPrefetcher
+
+# numpy and plotly are imported inside the functions that need them so a fresh
+# worker can serve the first (city-less) page without paying for them.
+
 # ============================================================================
 # CONFIGURATION
 # ============================================================================
@@ -25,15 +51,22 @@ COLORS = {
 }
 
 # Category Colors
-CATEGORIES = ["Economic", "Environmental", "Social"]
 CATEGORY_COLORS = {
     "Economic": COLORS["primary"],
     "Environmental": "#4FB7FF",
     "Social": "#9AD2FF",
 }
 
-# Years Range
-YEARS = list(range(2025, 2036))
+# Time series chart: ~1 point per 3 px at the header chart's width (~720 px)
+TIME_SERIES_MAX_POINTS = 240
+TIME_SERIES_MARKER_LIMIT = 40
+TIME_SERIES_TICK_YEARS = 5
+
+# 3D viewer quality governor: frame rate to hold, and the lowest quality level
+# (0-4, QUALITY_LEVELS in visuals/city_test.html) it may step down to.
+# A city's config can override both with viewer_target_fps / viewer_quality_floor.
+VIEWER_TARGET_FPS = 45
+VIEWER_QUALITY_FLOOR = 0
 
 
 # ============================================================================
@@ -140,67 +173,34 @@ def apply_custom_css():
 
 
 # ============================================================================
-# DATA DEFINITIONS
+# CITY VISUAL
 # ============================================================================
 
-CITY_DATA = {
-    "Boston": {
-        "map_query": "Boston, Massachusetts, USA",
-        "map_area_km": 2.0,
-        "kpis": [
-                    # ENVIRONMENTAL
-                    {"name": "GHG reduction",              "category": "Environmental", "value": 5.6},
-                    {"name": "Energy efficiency",          "category": "Environmental", "value": 6.2},
-                    {"name": "Sustainable mode share",     "category": "Environmental", "value": 5.0},
-                    {"name": "Waste diversion",            "category": "Environmental", "value": 4.0},
-                    # ECONOMIC
-                    {"name": "Household savings",          "category": "Economic",      "value": 5.4},
-                    {"name": "Jobs created",               "category": "Economic",      "value": 5.1},
-                    {"name": "Productivity gains",         "category": "Economic",      "value": 4.8},
-                    {"name": "Locally-owned businesses",   "category": "Economic",      "value": 5.0},
-                    # SOCIAL
-                    {"name": "Housing affordability",      "category": "Social",        "value": 4.7},
-                    {"name": "Public health",              "category": "Social",        "value": 5.5},
-                    {"name": "Equity of Accessibility",    "category": "Social",        "value": 4.9},
-                ],
-        "time_series": {
-            "economy": [98, 100, 103, 105, 108, 111, 114, 118, 121, 124, 128],
-            "environment": [152, 149, 145, 142, 138, 134, 131, 126, 122, 119, 116],
-            "health": [84, 86, 88, 90, 92, 94, 97, 99, 101, 103, 106],
-        },
-    },
-    "San Sebastian": {
-        "map_query": "Donostia-San Sebastian, Spain",
-        "map_area_km": 1.5,
-        "kpis": [
-            # ENVIRONMENTAL
-            {"name": "GHG reduction",              "category": "Environmental", "value": 4.8},
-            {"name": "Energy efficiency",          "category": "Environmental", "value": 5.4},
-            {"name": "Sustainable mode share",     "category": "Environmental", "value": 4.6},
-            {"name": "Waste diversion",            "category": "Environmental", "value": 3.6},
-            # ECONOMIC
-            {"name": "Household savings",          "category": "Economic",      "value": 4.9},
-            {"name": "Jobs created",               "category": "Economic",      "value": 4.7},
-            {"name": "Productivity gains",         "category": "Economic",      "value": 4.2},
-            {"name": "Locally-owned businesses",   "category": "Economic",      "value": 4.6},
-            # SOCIAL
-            {"name": "Housing affordability",      "category": "Social",        "value": 4.2},
-            {"name": "Public health",              "category": "Social",        "value": 4.9},
-            {"name": "Equity of Accessibility",    "category": "Social",        "value": 4.4},
-        ],
-        "time_series": {
-            "economy": [93, 95, 96, 99, 101, 103, 106, 109, 112, 114, 118],
-            "environment": [164, 161, 158, 154, 151, 147, 144, 140, 136, 133, 130],
-            "health": [79, 80, 82, 83, 85, 87, 89, 91, 93, 95, 98],
-        },
-    },
-}
-
-
 @st.cache_data(show_spinner=False)
 def load_city_visual_template() -> str:
     template_path = pathlib.Path("visuals/city_test.html")
-    return template_path.read_text(encoding="utf-8")
+    template = template_path.read_text(encoding="utf-8")
+    # An inline (srcdoc) page has no URL to load city_worker.js from, so the
+    # worker source rides along and is started from a Blob.
+    worker_source = pathlib.Path("visuals/city_worker.js").read_text(encoding="utf-8")
+    worker_json = json.dumps(worker_source).replace("</", "<\\/")
+    marker = "const WORKER_SOURCE = null; // __CITY_WORKER_SOURCE__"
+    return template.replace(marker, f"const WORKER_SOURCE = {worker_json};")
+
+
+@st.cache_data(show_spinner=False)
+def _static_shell_url(shell_name: str, manifest_version):
+    return viewer_assets.shell_url(shell_name)
+
+
+def load_static_shell_url(shell_name: str):
+    """Hashed shell page under app/static/, (re)built when its sources changed.
+
+    Keyed on the manifest's mtime: a rebuild deletes the old hashed files,
+    so a URL cached from before it would 404.
+    """
+    viewer_assets.ensure_built()
+    return _static_shell_url(shell_name, viewer_assets.manifest_version())
 
 
 def render_city_visual(city_config: dict, height_scale: float, *, height: int = 520) -> None:
@@ -209,7 +209,6 @@ def render_city_visual(city_config: dict, height_scale: float, *, height: int =
         f"city-viz-{uuid.uuid4().hex}",
     )
 
-    html_template = load_city_visual_template()
     marker = "const EMBEDDED_CONFIG = {}; // __CITY_VIZ_EMBED_CONFIG__"
 
     city_query = city_config.get("map_query") or ""
@@ -218,6 +217,12 @@ def render_city_visual(city_config: dict, height_scale: float, *, height: int =
     except (TypeError, ValueError):
         area_value = 1.5
     height_value = round(float(height_scale), 3)
+    quality = {
+        "targetFps": city_config.get("viewer_target_fps", VIEWER_TARGET_FPS),
+        "qualityFloor": city_config.get("viewer_quality_floor", VIEWER_QUALITY_FLOOR),
+    }
+    # center / geometryUrl when the prefetcher already warmed this city
+    warm = geodata.peek_city(city_query, area_value) if city_query else {}
 
     defaults = {
         "autoBootstrap": True,
@@ -229,13 +234,26 @@ def render_city_visual(city_config: dict, height_scale: float, *, height: int =
         "heightScale": height_value,
         "agentSpeedMin": 85,
         "agentSpeedSpread": 35,
+        **quality,
+        **warm,
+        **geodata.viewer_endpoints(),
+        **telemetry.viewer_config(),
     }
 
-    config_json = json.dumps(defaults).replace("</", "<\\/")
-    html = html_template.replace("__FRAME_ID__", frame_id)
-    if marker in html:
-        html = html.replace(marker, f"const EMBEDDED_CONFIG = {config_json};")
-    st.components.v1.html(html, height=height)
+    viewer_url = load_static_shell_url("viewer")
+    if not viewer_url and viewer_assets.offline():
+        st.error("3D viewer assets are not built. Run `python viewer_assets.py fetch` "
+                 "on a machine with network access and copy visuals/vendor/ here.")
+        return
+    if viewer_url:
+        # cached static shell: constant src, config arrives via setConfig below
+        st.components.v1.iframe(f"{viewer_url}?frameId={frame_id}", height=height)
+    else:
+        config_json = json.dumps(defaults).replace("</", "<\\/")
+        html = load_city_visual_template().replace("__FRAME_ID__", frame_id)
+        if marker in html:
+            html = html.replace(marker, f"const EMBEDDED_CONFIG = {config_json};")
+        st.components.v1.html(html, height=height)
 
     payload = {
         "hideUI": True,
@@ -246,6 +264,10 @@ def render_city_visual(city_config: dict, height_scale: float, *, height: int =
         "heightScale": height_value,
         "agentSpeedMin": 85,
         "agentSpeedSpread": 35,
+        **quality,
+        **warm,
+        **geodata.viewer_endpoints(),
+        **telemetry.viewer_config(),
     }
 
     prev_city = st.session_state.get("city_visual_prev_city")
@@ -279,12 +301,31 @@ def send_city_visual_config(frame_id: str, payload: dict) -> None:
         "action": "setConfig",
         "config": payload,
     }
+    post_to_frame(frame_id, message, ack_flag="__cityVizAck")
+
+
+def post_to_frame(frame_id: str, message: dict, *, ack_flag: str, stash: str = None) -> None:
+    """postMessage `message` into the iframe with id `frame_id`, retrying until it
+    answers with `{<ack_flag>: true, frameId}` (the frame may still be loading).
+
+    With `stash`, the message is also left on the Streamlit page as
+    `window[stash][frame_id]`, for a frame that loads after the retries stop.
+    """
     message_json = json.dumps(message).replace("</", "<\\/")
+    stash_json = json.dumps(stash)
     script = f"""
     <script>
     (function() {{
         const payload = {message_json};
         const frameId = "{frame_id}";
+        const stash = {stash_json};
+        if (stash) try {{
+            const page = window.parent;
+            page[stash] = page[stash] || {{}};
+            page[stash][frameId] = payload;
+        }} catch (err) {{
+            console.warn('frame stash failed', frameId, err);
+        }}
         let attempts = 0;
         const maxAttempts = 25;
         const delayMs = 200;
@@ -292,7 +333,8 @@ def send_city_visual_config(frame_id: str, payload: dict) -> None:
 
         const handleAck = (event) => {{
             const data = event.data;
-            if (data && data.__cityVizAck && data.frameId === frameId) {{
+            if (data && data.{ack_flag} && data.frameId === frameId) {{
+                if (data.ok === false) console.warn('frame rejected message', frameId, data);
                 acknowledged = true;
                 window.removeEventListener('message', handleAck);
                 if (window.parent) try {{ window.parent.removeEventListener('message', handleAck); }} catch (_) {{}}
@@ -312,7 +354,7 @@ def send_city_visual_config(frame_id: str, payload: dict) -> None:
                     frame.contentWindow.postMessage(payload, '*');
                 }}
             }} catch (err) {{
-                console.warn('city viz dispatch attempt failed', err);
+                console.warn('frame dispatch attempt failed', frameId, err);
             }}
             if (!acknowledged && attempts < maxAttempts) {{
                 setTimeout(send, delayMs);
@@ -325,169 +367,14 @@ def send_city_visual_config(frame_id: str, payload: dict) -> None:
     st.components.v1.html(script, height=0, width=0)
 
 
-INTERVENTIONS = [
-    {
-        "id": "urban_form",
-        "label": "Urban Form",
-        "impact_weights": {"Economic": 0.45, "Environmental": 0.15, "Social": 0.40},
-        "sub_sliders": [
-            {"label": "Upzoning", "min": 0, "max": 100, "value": 0},
-            {"label": "Mixed-Use Development", "min": 0, "max": 100, "value": 0}
-        ]
-    },
-    {
-        "id": "building_efficiency",
-        "label": "Building Efficiency",
-        "impact_weights": {"Economic": 0.25, "Environmental": 0.55, "Social": 0.20},
-        "sub_sliders": [
-            {"label": "Retrofits", "min": 0, "max": 100, "value": 0},
-            {"label": "Standards", "min": 0, "max": 100, "value": 0}
-        ]
-    },
-    {
-        "id": "clean_energy",
-        "label": "Clean Energy",
-        "impact_weights": {"Economic": 0.35, "Environmental": 0.45, "Social": 0.20},
-        "sub_sliders": [
-            {"label": "Solar", "min": 0, "max": 100, "value": 0},
-            {"label": "Wind", "min": 0, "max": 100, "value": 0},
-            {"label": "Geothermal", "min": 0, "max": 100, "value": 0},
-            {"label": "Hydro", "min": 0, "max": 100, "value": 0},
-            {"label": "Nuclear", "min": 0, "max": 100, "value": 0}
-        ]
-    },
-    {
-        "id": "urban_freight",
-        "label": "Urban Freight",
-        "impact_weights": {"Economic": 0.35, "Environmental": 0.45, "Social": 0.20},
-        "sub_sliders": [
-            {"label": "Cargo Bikes", "min": 0, "max": 100, "value": 0},
-            {"label": "Consolidation", "min": 0, "max": 100, "value": 0},
-            {"label": "Restrictions", "min": 0, "max": 100, "value": 0},
-            {"label": "Fees", "min": 0, "max": 100, "value": 0}
-        ]
-    },
-    {
-        "id": "active_mobility",
-        "label": "Active Mobility",
-        "impact_weights": {"Economic": 0.25, "Environmental": 0.40, "Social": 0.35},
-        "sub_sliders": [
-            {"label": "Coverage", "min": 0, "max": 100, "value": 0},
-            {"label": "Connectivity", "min": 0, "max": 100, "value": 0},
-            {"label": "Safety", "min": 0, "max": 100, "value": 0}
-        ]
-    },
-    {
-        "id": "public_transit",
-        "label": "Public Transit",
-        "impact_weights": {"Economic": 0.20, "Environmental": 0.35, "Social": 0.45},
-        "sub_sliders": [
-            {"label": "Electrification", "min": 0, "max": 100, "value": 0},
-            {"label": "Coverage", "min": 0, "max": 100, "value": 0},
-            {"label": "Fare Subsidies", "min": 0, "max": 100, "value": 0}
-        ]
-    },
-    {
-        "id": "waste",
-        "label": "Waste Systems",
-        "impact_weights": {"Economic": 0.10, "Environmental": 0.60, "Social": 0.30},
-        "sub_sliders": [
-            {"label": "Recycling", "min": 0, "max": 100, "value": 0},
-            {"label": "Composting", "min": 0, "max": 100, "value": 0},
-            {"label": "Digestion", "min": 0, "max": 100, "value": 0}
-        ]
-    }
-]
-
-# ----------------------------------------------------------------------------
-# KPI influence matrix (H/M/L from the grid; blanks are Low)
-# ----------------------------------------------------------------------------
-
-INFLUENCE_NUM = {"none": 0.0, "L": 0.35, "M": 0.70, "H": 1.00}
-
-
-# keys: KPI name -> intervention_id -> "H"/"M"/"L"
-KPI_INFLUENCE = {
-    # ENVIRONMENTAL
-    "GHG reduction": {
-        "urban_form": "H", "building_efficiency": "H", "clean_energy": "H",
-        "urban_freight": "M", "active_mobility": "H", "public_transit": "H",
-        "waste": "M",
-    },
-    "Energy efficiency": {
-        "urban_form": "L", "building_efficiency": "H", "clean_energy": "L",
-        "urban_freight": "M", "active_mobility": "M", "public_transit": "M",
-        "waste": "M",
-    },
-    "Sustainable mode share": {
-        "urban_form": "H", "building_efficiency": "L", "clean_energy": "L",
-        "urban_freight": "L", "active_mobility": "H", "public_transit": "H",
-        "waste": "L",
-    },
-    "Waste diversion": {
-        "urban_form": "L", "building_efficiency": "L", "clean_energy": "L",
-        "urban_freight": "L", "active_mobility": "L", "public_transit": "L",
-        "waste": "H",
-    },
-
-    # ECONOMIC
-    "Household savings": {
-        "urban_form": "M", "building_efficiency": "H", "clean_energy": "L",
-        "urban_freight": "L", "active_mobility": "M", "public_transit": "M",
-        "waste": "L",
-    },
-    "Jobs created": {
-        "urban_form": "L", "building_efficiency": "H", "clean_energy": "H",
-        "urban_freight": "M", "active_mobility": "L", "public_transit": "M",
-        "waste": "M",
-    },
-    "Productivity gains": {
-        "urban_form": "M", "building_efficiency": "L", "clean_energy": "L",
-        "urban_freight": "M", "active_mobility": "H", "public_transit": "H",
-        "waste": "L",
-    },
-    "Locally-owned businesses": {
-        "urban_form": "H", "building_efficiency": "L", "clean_energy": "L",
-        "urban_freight": "M", "active_mobility": "H", "public_transit": "L",
-        "waste": "L",
-    },
-
-    # SOCIAL
-    "Housing affordability": {
-        "urban_form": "H", "building_efficiency": "H", "clean_energy": "L",
-        "urban_freight": "L", "active_mobility": "L", "public_transit": "L",
-        "waste": "L",
-    },
-    "Public health": {
-        "urban_form": "H", "building_efficiency": "L", "clean_energy": "H",
-        "urban_freight": "M", "active_mobility": "H", "public_transit": "H",
-        "waste": "M",
-    },
-    "Equity of Accessibility": {
-        "urban_form": "H", "building_efficiency": "L", "clean_energy": "L",
-        "urban_freight": "L", "active_mobility": "H", "public_transit": "H",
-        "waste": "L",
-    },
-}
-
-
 # ============================================================================
 # UTILITY FUNCTIONS
 # ============================================================================
 
-def find_city(search_text: str) -> str:
-    """Find city by search text or return first city."""
-    if not search_text:
-        return list(CITY_DATA.keys())[0]
-    search_lower = search_text.strip().lower()
-    for city in CITY_DATA:
-        if city.lower().startswith(search_lower):
-            return city
-    return list(CITY_DATA.keys())[0]
-
-
 def compute_category_scores() -> dict:
     """Calculate category scores based on intervention settings."""
+    import numpy as np
+
     scores = {cat: 0.0 for cat in CATEGORIES}
     for intervention in INTERVENTIONS:
         main_value = float(st.session_state.get(f"main_{intervention['id']}", 0))
@@ -503,61 +390,56 @@ def compute_category_scores() -> dict:
     return {k: min(v, 100.0) for k, v in scores.items()}
 
 
-#for time series chart
-def category_improvement_from_kpis(current_vals, improved_vals, kpi_categories):
-    cats = ["Economic", "Environmental", "Social"]
-    out = {c: 0.0 for c in cats}
-    for c in cats:
-        cur = [cv for cv, cat in zip(current_vals, kpi_categories) if cat == c]
-        imp = [iv for iv, cat in zip(improved_vals, kpi_categories) if cat == c]
-        if not cur:
-            continue
-        cur_mean = float(np.mean(cur))
-        imp_mean = float(np.mean(imp))
-        delta = max(0.0, (imp_mean - cur_mean) / 10.0)  # 0..1
-        out[c] = min(delta, 1.0)
-    return out
-
-
-
-
 def get_intervention_intensities() -> dict:
     return {it["id"]: float(st.session_state.get(f"main_{it['id']}", 0))
             for it in INTERVENTIONS}
 
+def _kpi_lifts(city_key: str, intensities: dict, simulate: bool) -> tuple:
+    return tuple(mobility_lifts(city_key, intensities).items()) if simulate else ()
+
+
 def calculate_improved_kpis(city_key: str) -> list:
     intensities = get_intervention_intensities()
+    simulate = st.session_state.get("simulate_mobility", False)
+    return list(improve_kpis(city_key, tuple(intensities.items()),
+                             _kpi_lifts(city_key, intensities, simulate)))
+
+
+# ----------------------------------------------------------------------------
+# Background prefetch (City Search)
+# ----------------------------------------------------------------------------
+
+def _warm_geocode(city_key: str, _kpi_context: tuple) -> None:
+    geodata.geocode_city(CITY_DATA[city_key]["map_query"])
 
-    # ↑ make the radar more sensitive by increasing this
-    IMPACT_TO_LIFT = 1.40            # was 0.35
 
-    improved = []
-    for kpi in CITY_DATA[city_key]["kpis"]:
-        base = float(kpi["value"])
-        name = kpi["name"]
+def _warm_geometry(city_key: str, _kpi_context: tuple) -> None:
+    city = CITY_DATA[city_key]
+    geodata.warm_city(city["map_query"], float(city.get("map_area_km", 1.5)))
 
-        # collect only interventions that actually influence this KPI
-        parts = []
-        max_parts = []
-        for it in INTERVENTIONS:
-            level = KPI_INFLUENCE.get(name, {}).get(it["id"], "none")
-            w = INFLUENCE_NUM[level]
-            if w > 0:
-                parts.append((intensities[it["id"]] / 100.0) * w)
-                max_parts.append(1.0)  # this intervention could contribute up to 1.0
 
-        if not parts:
-            improved.append(base)  # no links → no change
-            continue
+def _warm_kpis(city_key: str, kpi_context: tuple) -> None:
+    # same cache key as calculate_improved_kpis; runs after _warm_geometry so
+    # simulated lifts use the street network the foreground will see
+    intensity_items, simulate = kpi_context
+    improve_kpis(city_key, intensity_items, _kpi_lifts(city_key, dict(intensity_items), simulate))
 
-        # optional: slightly convex response so high sliders punch more
-        total = sum((p ** 0.9) for p in parts)     # 0.9 → gentle convexity
-        max_possible = sum(max_parts)              # count ONLY linked interventions
-        normalized = min(total / max_possible, 1.0)
 
-        lift = 1.0 + normalized * IMPACT_TO_LIFT   # 0%..80% boost
-        improved.append(round(min(base * lift, 10.0), 2))
-    return improved
+@st.cache_resource(show_spinner=False)
+def get_prefetcher() -> CityPrefetcher:
+    return CityPrefetcher([_warm_geocode, _warm_geometry, _warm_kpis], max_workers=2)
+
+
+def prefetch_candidates(search_text: str) -> None:
+    """Warm the top matches for the current search text in the background.
+
+    Only the search text starts a new generation; the slider state rides
+    along as context, so moving a slider never restarts the warm-up.
+    """
+    owner = st.session_state.setdefault("prefetch_owner", uuid.uuid4().hex)
+    kpi_context = (tuple(get_intervention_intensities().items()),
+                   st.session_state.get("simulate_mobility", False))
+    get_prefetcher().submit(owner, candidate_cities(search_text), kpi_context)
 
 
 def slider_to_height_scale(value: float) -> float:
@@ -572,36 +454,10 @@ def slider_to_height_scale(value: float) -> float:
 # CHART FUNCTIONS
 # ============================================================================
 
-def create_radar_chart(current: list, improved: list, labels: list, categories: list):
-    """Readable radar: bigger KPI labels, more padding, legend moved out of the plot."""
+def _radar_layout() -> dict:
+    """Radar layout minus the per-call angular ticks (see load_chart_tables)."""
     max_value = 10
-    n_points = len(labels)
-    angles = np.linspace(0, 360, n_points, endpoint=False)
-    theta_values = angles.tolist() + [angles[0]]
-
-    traces = [
-        go.Scatterpolar(
-            r=current + [current[0]],
-            theta=theta_values,
-            name="Current",
-            mode="lines",
-            line=dict(color=COLORS["primary_mid"], width=2.5),
-            fill="toself",
-            fillcolor="rgba(115,192,255,0.20)",
-        ),
-        go.Scatterpolar(
-            r=improved + [improved[0]],
-            theta=theta_values,
-            name="2035",
-            mode="lines",
-            line=dict(color=COLORS["primary"], width=3.5),
-            fill="toself",
-            fillcolor="rgba(57,168,255,0.28)",
-        ),
-    ]
-
-    fig = go.Figure(traces)
-    fig.update_layout(
+    return dict(
         height=500,                                   # more canvas for labels
         margin=dict(l=64, r=64, t=48, b=48),          # extra breathing room
         paper_bgcolor="rgba(0,0,0,0)",
@@ -622,8 +478,6 @@ def create_radar_chart(current: list, improved: list, labels: list, categories:
             # rotate so long labels sit left/right (least clipping)
             angularaxis=dict(
                 tickmode="array",
-                tickvals=angles,
-                ticktext=labels,
                 rotation=58,
                 direction="clockwise",
                 color=COLORS["muted"],
@@ -637,61 +491,10 @@ def create_radar_chart(current: list, improved: list, labels: list, categories:
             ),
         ),
     )
-    return fig
-
 
 
-def create_time_series_chart(city_key: str, cat_deltas: dict):
-    """
-    Time series with improved readability:
-    - larger legend
-    - thicker lines and bigger markers
-    - bigger year labels (every year shown)
-    """
-    ts = CITY_DATA[city_key]["time_series"]
-    n = len(YEARS)
-    t = np.arange(n)
-
-    econ_start = float(ts["economy"][0])
-    env_start  = float(ts["environment"][0])
-    soc_start  = float(ts["health"][0])
-
-    TOTAL_RANGE = {"Economic": 40.0, "Environmental": 50.0, "Social": 30.0}
-
-    econ_step = (TOTAL_RANGE["Economic"] * cat_deltas.get("Economic", 0.0)) / max(1, n - 1)
-    env_step  = (-TOTAL_RANGE["Environmental"] * cat_deltas.get("Environmental", 0.0)) / max(1, n - 1)
-    soc_step  = (TOTAL_RANGE["Social"] * cat_deltas.get("Social", 0.0)) / max(1, n - 1)
-
-    NOISE_LEVEL = float(st.session_state.get("noise_level", 0.10))
-    rng = np.random.default_rng(abs(hash(city_key)) % (2**32))
-
-    def smooth_noise(step, delta):
-        if delta <= 1e-12 or NOISE_LEVEL <= 1e-6:
-            return np.zeros(n)
-        amp = abs(step) * 0.25 * NOISE_LEVEL
-        sinus = np.sin(np.linspace(0, 2 * np.pi, n)) * amp * 0.85
-        rand = rng.normal(0, amp * 0.15, size=n)
-        return (sinus + rand) * delta
-
-    econ = econ_start + t * econ_step + smooth_noise(econ_step, cat_deltas.get("Economic", 0.0))
-    env  = env_start  + t * env_step  + smooth_noise(env_step,  cat_deltas.get("Environmental", 0.0))
-    soc  = soc_start  + t * soc_step  + smooth_noise(soc_step,  cat_deltas.get("Social", 0.0))
-
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(
-        x=YEARS, y=econ, name="Economy", mode="lines+markers",
-        line=dict(color=COLORS["primary"], width=3), marker=dict(size=5)
-    ))
-    fig.add_trace(go.Scatter(
-        x=YEARS, y=env, name="Environment", mode="lines+markers",
-        line=dict(color=COLORS["primary_mid"], width=3, dash="dash"), marker=dict(size=5)
-    ))
-    fig.add_trace(go.Scatter(
-        x=YEARS, y=soc, name="Health/Social", mode="lines+markers",
-        line=dict(color=COLORS["primary_light"], width=3, dash="dot"), marker=dict(size=5)
-    ))
-
-    fig.update_layout(
+def _time_series_layout() -> dict:
+    return dict(
         height=200,
         margin=dict(l=24, r=12, t=8, b=36),
         paper_bgcolor="rgba(0,0,0,0)",
@@ -708,8 +511,8 @@ def create_time_series_chart(city_key: str, cat_deltas: dict):
         ),
         xaxis=dict(
             title="",
-            tickvals=YEARS,                 # show every year
-            ticktext=[str(y) for y in YEARS],
+            tickvals=YEARS[::TIME_SERIES_TICK_YEARS],
+            ticktext=[str(y) for y in YEARS[::TIME_SERIES_TICK_YEARS]],
             tickangle=0,
             showgrid=False, zeroline=False,
             color=COLORS["muted"],
@@ -722,6 +525,116 @@ def create_time_series_chart(city_key: str, cat_deltas: dict):
             tickfont=dict(size=11, family="Inter, Montserrat, system-ui, sans-serif"),
         ),
     )
+
+
+def _build_chart_tables() -> dict:
+    from model import KPI_INFLUENCE
+
+    return {
+        "wrapped_labels": {name: _wrap_label(name) for name in KPI_INFLUENCE},
+        "radar_layout": _radar_layout(),
+        "time_series_layout": _time_series_layout(),
+    }
+
+
+@st.cache_resource(show_spinner=False)
+def load_chart_tables() -> dict:
+    """Label wraps and chart layouts, warm-loaded from .startup_cache/ while app.py is unchanged."""
+    key = startup.source_key(pathlib.Path(__file__).read_text(encoding="utf-8"))
+    return startup.load_artifact("chart_tables", key, _build_chart_tables)
+
+
+def render_chart(fig, key: str, *, height: int, config: dict = None) -> None:
+    """Draw `fig` in the static chart host, sending only trace data while the
+    layout is unchanged; falls back to st.plotly_chart when the host isn't built."""
+    config = config or {}
+    host_url = load_static_shell_url("chart_host")
+    if not host_url:
+        st.plotly_chart(fig, use_container_width=True, config=config)
+        return
+
+    chart_id = st.session_state.setdefault(f"chart_frame_{key}", f"chart-{key}-{uuid.uuid4().hex}")
+    st.components.v1.iframe(f"{host_url}?chartId={chart_id}", height=height)
+
+    signature_key = f"chart_signature_{key}"
+    message, signature = chart_transport.build_message(fig, st.session_state.get(signature_key), config)
+    st.session_state[signature_key] = signature
+    seq = st.session_state["chart_seq"] = st.session_state.get("chart_seq", 0) + 1
+    message.update({"__chartHost": True, "chartId": chart_id, "seq": seq})
+    # Full renders are also left on the page: the signature above is stored
+    # before delivery, so a host that misses the render's retries (e.g. still
+    # loading plotly.js) picks it up there before applying later patches.
+    stash = "__chartHostPending" if message["action"] == "render" else None
+    post_to_frame(chart_id, message, ack_flag="__chartHostAck", stash=stash)
+
+
+def create_radar_chart(current: list, improved: list, labels: list, categories: list):
+    """Readable radar: bigger KPI labels, more padding, legend moved out of the plot."""
+    import numpy as np
+    from plotly import graph_objects as go
+
+    n_points = len(labels)
+    angles = np.linspace(0, 360, n_points, endpoint=False)
+    theta_values = np.append(angles, angles[0])
+
+    traces = [
+        go.Scatterpolar(
+            r=np.array(current + [current[0]], dtype=float),
+            theta=theta_values,
+            name="Current",
+            mode="lines",
+            line=dict(color=COLORS["primary_mid"], width=2.5),
+            fill="toself",
+            fillcolor="rgba(115,192,255,0.20)",
+        ),
+        go.Scatterpolar(
+            r=np.array(improved + [improved[0]], dtype=float),
+            theta=theta_values,
+            name=str(TARGET_YEAR),
+            mode="lines",
+            line=dict(color=COLORS["primary"], width=3.5),
+            fill="toself",
+            fillcolor="rgba(57,168,255,0.28)",
+        ),
+    ]
+
+    layout = copy.deepcopy(load_chart_tables()["radar_layout"])
+    layout["polar"]["angularaxis"].update(tickvals=angles, ticktext=labels)
+    return go.Figure(traces, layout=layout)
+
+
+
+def create_time_series_chart(city_key: str, cat_deltas: dict, *, max_points: int = TIME_SERIES_MAX_POINTS):
+    """
+    Monthly index projection to the end of the horizon, LTTB-downsampled so the
+    figure never carries more than `max_points` points per line:
+    - larger legend
+    - thicker lines (markers only while the series is sparse)
+    - year labels every TIME_SERIES_TICK_YEARS
+    """
+    from plotly import graph_objects as go
+
+    noise_level = float(st.session_state.get("noise_level", 0.10))
+    t, series = project_category_indices(
+        city_key, cat_deltas, noise_level, seed=abs(hash(city_key)) % (2**32)
+    )
+
+    styles = [
+        ("Economy", dict(color=COLORS["primary"], width=3)),
+        ("Environment", dict(color=COLORS["primary_mid"], width=3, dash="dash")),
+        ("Health/Social", dict(color=COLORS["primary_light"], width=3, dash="dot")),
+    ]
+    fig = go.Figure()
+    for (name, line), y in zip(styles, series):
+        x_ds, y_ds = lttb(t, y, max_points)
+        fig.add_trace(go.Scatter(
+            x=x_ds, y=y_ds, name=name,
+            mode="lines+markers" if len(x_ds) <= TIME_SERIES_MARKER_LIMIT else "lines",
+            line=line, marker=dict(size=5),
+            hovertemplate="%{x:.2f}: %{y:.1f}<extra>" + name + "</extra>",
+        ))
+
+    fig.update_layout(load_chart_tables()["time_series_layout"])
     return fig
 
 def _wrap_label(s: str) -> str:
@@ -769,7 +682,7 @@ def _on_main_change(iid, sub_defs):
     for sd in sub_defs:
         sk = f"{iid}_{sd['label']}"
         vals.append(float(st.session_state.get(sk, sd["value"])))
-    avg = np.mean(vals) if vals else 0.0
+    avg = sum(vals) / len(vals) if vals else 0.0
 
     if avg <= 0:
         # distribute evenly if subs are zero/undefined
@@ -786,7 +699,7 @@ def _on_sub_change(iid, sub_defs):
     if not sub_defs:
         return
     vals = [float(st.session_state[f"{iid}_{sd['label']}"]) for sd in sub_defs]
-    st.session_state[f"main_{iid}"] = int(round(np.mean(vals)))
+    st.session_state[f"main_{iid}"] = int(round(sum(vals) / len(vals)))
 
 def render_intervention_slider(intervention: dict):
     """
@@ -845,7 +758,8 @@ def render_intervention_slider(intervention: dict):
 
 def main():
     """Compact header row with aligned search/time-series, followed by city visual, radar, and interventions."""
-    apply_custom_css()
+    with startup.span("custom css"):
+        apply_custom_css()
 
     header_left, header_mid, header_right = st.columns([0.26, 0.26, 0.48], gap="medium")
 
@@ -864,6 +778,8 @@ def main():
         )
         st.markdown("</div>", unsafe_allow_html=True)
 
+    prefetch_candidates(search_query)
+
     has_city_input = bool(search_query.strip())
     city_key = find_city(search_query) if has_city_input else None
 
@@ -887,8 +803,9 @@ def main():
     with header_right:
         st.markdown("<div class='section-label'>Time Series Projection</div>", unsafe_allow_html=True)
         if city_key:
-            ts_chart = create_time_series_chart(city_key, category_scores)
-            st.plotly_chart(ts_chart, use_container_width=True, config={"displayModeBar": False})
+            with startup.span("time series chart"):
+                ts_chart = create_time_series_chart(city_key, category_scores)
+            render_chart(ts_chart, "time_series", height=200, config={"displayModeBar": False})
         else:
             st.info("Enter a city to view projections.")
 
@@ -907,7 +824,8 @@ def main():
         st.markdown("<div class='section-label'>Overview</div>", unsafe_allow_html=True)
         if city_key:
             try:
-                render_city_visual(CITY_DATA[city_key], height_scale)
+                with startup.span("city visual"):
+                    render_city_visual(CITY_DATA[city_key], height_scale)
             except Exception as exc:
                 st.error("🗺️ Unable to load the city visualization.")
                 st.exception(exc)
@@ -917,9 +835,11 @@ def main():
     with row2_right:
         st.markdown("<div class='section-label'>KPI Radar</div>", unsafe_allow_html=True)
         if city_key:
-            labels_wrapped = [_wrap_label(k["name"]) for k in kpis]
-            radar_chart = create_radar_chart(current_values, improved_values, labels_wrapped, categories)
-            st.plotly_chart(radar_chart, use_container_width=True, config={"displayModeBar": False})
+            wrapped = load_chart_tables()["wrapped_labels"]
+            labels_wrapped = [wrapped.get(k["name"]) or _wrap_label(k["name"]) for k in kpis]
+            with startup.span("radar chart"):
+                radar_chart = create_radar_chart(current_values, improved_values, labels_wrapped, categories)
+            render_chart(radar_chart, "radar", height=500, config={"displayModeBar": False})
         else:
             st.info("KPI radar will appear after selecting a city.")
 
@@ -939,6 +859,15 @@ def main():
             for intervention_id in group:
                 intervention = next(i for i in INTERVENTIONS if i["id"] == intervention_id)
                 render_intervention_slider(intervention)
+    with int_col4:
+        st.toggle(
+            "Simulate mobility KPIs",
+            key="simulate_mobility",
+            help="Drive Sustainable mode share and Equity of Accessibility from an "
+                 "agent simulation of the street network instead of fixed weights.",
+        )
+
+    startup.report()
 
 
 if __name__ == "__main__":
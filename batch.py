@@ -0,0 +1,295 @@
+"""Headless batch scoring: every city x every intervention package.
+
+    python batch.py scenarios.json out/                # packages from a file
+    python batch.py --grid 0,50,100 out/               # full factorial of levels
+    python batch.py scenarios.json out/ --jobs 8 --shard-size 100 --simulate-mobility
+
+A package file is a JSON list (or JSON Lines) of
+`{"name": ..., "intensities": {"<intervention id>": 0-100, ...}}`; missing
+interventions are 0.
+
+The job is split into shards of `--shard-size` packages for one city and
+run on a process pool with a bounded number of shards in flight. Each shard is
+scored with `model.improve_kpis` / `model.project_kpis` and written by its
+worker as one Parquet file, `part-<city index>-<shard>.parquet` (the index
+into `_job.json`'s "cities"), through a temp file and rename. A finished part
+file is the checkpoint: rerunning the same command skips those shards and
+resumes the rest. `_job.json` pins the job spec, so a
+resume with different inputs is refused instead of mixing results. With
+`--simulate-mobility` it also pins each city's street network (the cached
+geometry digest at job start, or the synthetic grid): a resume simulates on
+the same streets even if the city cache has changed since.
+
+Rows are long format, one per (city, package, KPI): current and improved
+values, the KPI trajectory every `--years`, plus the package intensities.
+Read the directory with `pyarrow.dataset` or `pandas.read_parquet(out/)`.
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import logging
+import os
+import pathlib
+import sys
+import time
+
+import geodata
+from model import (CITY_DATA, INTERVENTIONS, STEPS_PER_YEAR, YEARS, improve_kpis, mobility_lifts,
+                   mobility_network_source, project_kpis)
+
+logger = logging.getLogger(__name__)
+
+JOB_FILE = "_job.json"  # "_" prefix: skipped by pyarrow.dataset readers
+DEFAULT_YEARS = (2030, 2035, 2040, 2050)
+
+
+# ============================================================================
+# JOB SPEC
+# ============================================================================
+
+def load_scenarios(path) -> list:
+    """Packages from a JSON list or JSON Lines file, validated and 0-filled."""
+    text = pathlib.Path(path).read_text(encoding="utf-8")
+    try:
+        raw = json.loads(text)
+    except ValueError:
+        raw = [json.loads(line) for line in text.splitlines() if line.strip()]
+    if isinstance(raw, dict):
+        raw = [raw]
+    ids = [it["id"] for it in INTERVENTIONS]
+    scenarios = []
+    for n, item in enumerate(raw):
+        intensities = item.get("intensities", {})
+        unknown = set(intensities) - set(ids)
+        if unknown:
+            raise ValueError(f"package {n}: unknown interventions {sorted(unknown)}")
+        scenarios.append({
+            "name": str(item.get("name", f"package-{n}")),
+            "intensities": {iid: float(intensities.get(iid, 0.0)) for iid in ids},
+        })
+    return scenarios
+
+
+def grid_scenarios(levels) -> list:
+    """Full factorial of `levels` over every intervention."""
+    ids = [it["id"] for it in INTERVENTIONS]
+    return [
+        {"name": "grid-" + "-".join(f"{v:g}" for v in combo), "intensities": dict(zip(ids, map(float, combo)))}
+        for combo in itertools.product(levels, repeat=len(ids))
+    ]
+
+
+def mobility_networks(out_dir: pathlib.Path, cities) -> dict:
+    """City -> pinned street network; an existing job's pins win so a resume keeps its streets."""
+    try:
+        pinned = json.loads((out_dir / JOB_FILE).read_text(encoding="utf-8")).get("mobility_networks") or {}
+    except (OSError, ValueError):
+        pinned = {}
+    networks = {city: pinned.get(city) or mobility_network_source(city) for city in cities}
+    for city, source in networks.items():
+        if source["digest"] is not None and geodata.load_geometry(source["digest"]) is None:
+            raise SystemExit(f"pinned street network {source['digest']} for {city} is no longer cached; "
+                             "use a new output directory")
+    return networks
+
+
+def job_spec(cities, scenarios, *, years, shard_size: int, simulate_mobility: bool,
+             networks: dict = None) -> dict:
+    body = {
+        "cities": list(cities),
+        "scenarios": scenarios,
+        "years": list(years),
+        "shard_size": shard_size,
+        "simulate_mobility": simulate_mobility,
+        "mobility_networks": networks,
+    }
+    digest = hashlib.sha1(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()
+    return {
+        "fingerprint": digest,
+        "cities": list(cities),
+        "n_scenarios": len(scenarios),
+        "years": list(years),
+        "shard_size": shard_size,
+        "simulate_mobility": simulate_mobility,
+        "mobility_networks": networks,
+    }
+
+
+def _shard_id(city_index: int, shard_index: int) -> str:
+    return f"{city_index:04d}-{shard_index:05d}"
+
+
+def part_path(out_dir: pathlib.Path, shard_id: str) -> pathlib.Path:
+    return out_dir / f"part-{shard_id}.parquet"
+
+
+# ============================================================================
+# WORKER
+# ============================================================================
+
+def run_shard(out_dir: str, shard_id: str, city_key: str, first_index: int, scenarios: list,
+              years: tuple, network_source: dict = None) -> tuple:
+    """Score one shard and write its part file; returns (shard_id, rows).
+
+    `network_source` is the city's pinned street network when mobility is
+    simulated, None to keep the static lifts.
+    """
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    kpis = CITY_DATA[city_key]["kpis"]
+    n_kpi = len(kpis)
+    n = len(scenarios) * n_kpi
+    steps = [(year - YEARS[0]) * STEPS_PER_YEAR for year in years]
+
+    improved = np.empty(n, dtype=np.float32)
+    trajectory = np.empty((len(years), n), dtype=np.float32)
+    for s, scenario in enumerate(scenarios):
+        items = tuple(scenario["intensities"].items())
+        lifts = (tuple(mobility_lifts(city_key, scenario["intensities"], network_source).items())
+                 if network_source is not None else ())
+        rows = slice(s * n_kpi, (s + 1) * n_kpi)
+        improved[rows] = improve_kpis(city_key, items, lifts)
+        _, values = project_kpis(city_key, items, lifts)
+        trajectory[:, rows] = values[:, steps].T
+
+    columns = {
+        "city": pa.DictionaryArray.from_arrays(np.zeros(n, dtype=np.int32), [city_key]),
+        "scenario_index": np.repeat(np.arange(first_index, first_index + len(scenarios), dtype=np.int32), n_kpi),
+        "scenario": pa.array(np.repeat([sc["name"] for sc in scenarios], n_kpi)).dictionary_encode(),
+        "kpi": pa.array([k["name"] for k in kpis] * len(scenarios)).dictionary_encode(),
+        "category": pa.array([k["category"] for k in kpis] * len(scenarios)).dictionary_encode(),
+        "current": np.tile(np.array([k["value"] for k in kpis], dtype=np.float32), len(scenarios)),
+        "improved": improved,
+    }
+    for year, row in zip(years, trajectory):
+        columns[f"y{year}"] = row
+    for it in INTERVENTIONS:
+        values = np.array([sc["intensities"][it["id"]] for sc in scenarios], dtype=np.float32)
+        columns[f"i_{it['id']}"] = np.repeat(values, n_kpi)
+
+    table = pa.table(columns)
+    target = part_path(pathlib.Path(out_dir), shard_id)
+    tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    pq.write_table(table, tmp, compression="zstd")
+    os.replace(tmp, target)
+    return shard_id, n
+
+
+# ============================================================================
+# DRIVER
+# ============================================================================
+
+def _prepare(out_dir: pathlib.Path, spec: dict) -> None:
+    """Create or validate _job.json; stale temp files of killed workers go."""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    job_path = out_dir / JOB_FILE
+    if job_path.exists():
+        existing = json.loads(job_path.read_text(encoding="utf-8"))
+        if existing.get("fingerprint") != spec["fingerprint"]:
+            raise SystemExit(f"{out_dir} holds a different job; use a new output directory")
+    else:
+        tmp = job_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(spec, indent=2), encoding="utf-8")
+        tmp.replace(job_path)
+    for stale in out_dir.glob(".part-*.tmp"):
+        stale.unlink(missing_ok=True)
+
+
+def run(scenarios: list, out_dir, *, cities=None, years=DEFAULT_YEARS, shard_size: int = 50,
+        jobs: int = None, simulate_mobility: bool = False) -> dict:
+    """Run (or resume) a batch; returns counts of shards done now / skipped."""
+    out_dir = pathlib.Path(out_dir)
+    cities = list(cities or CITY_DATA)
+    networks = mobility_networks(out_dir, cities) if simulate_mobility else None
+    spec = job_spec(cities, scenarios, years=years, shard_size=shard_size, simulate_mobility=simulate_mobility,
+                    networks=networks)
+    _prepare(out_dir, spec)
+
+    pending = []
+    skipped = 0
+    for ci, city_key in enumerate(cities):
+        for si, start in enumerate(range(0, len(scenarios), shard_size)):
+            shard_id = _shard_id(ci, si)
+            if part_path(out_dir, shard_id).exists():
+                skipped += 1
+                continue
+            pending.append((shard_id, city_key, start))
+    total = len(pending) + skipped
+    logger.warning("%d shards: %d already done, %d to run", total, skipped, len(pending))
+
+    jobs = jobs or os.cpu_count() or 1
+    window = 2 * jobs  # shards in flight; keeps the parent's memory flat
+    done = rows = 0
+    started = time.perf_counter()
+    tasks = iter(pending)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        in_flight = set()
+        try:
+            while True:
+                for shard_id, city_key, start in itertools.islice(tasks, window - len(in_flight)):
+                    in_flight.add(pool.submit(
+                        run_shard, str(out_dir), shard_id, city_key, start,
+                        scenarios[start:start + shard_size], tuple(years),
+                        networks[city_key] if networks else None,
+                    ))
+                if not in_flight:
+                    break
+                finished, in_flight = concurrent.futures.wait(
+                    in_flight, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in finished:
+                    _, n = future.result()
+                    done += 1
+                    rows += n
+                elapsed = time.perf_counter() - started
+                eta = elapsed / done * (len(pending) - done)
+                logger.warning("%d/%d shards, %d rows, %.0fs elapsed, ~%.0fs left",
+                               skipped + done, total, rows, elapsed, eta)
+        except BaseException:
+            for future in in_flight:
+                future.cancel()
+            raise
+    return {"done": done, "skipped": skipped, "rows": rows}
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Score every city against intervention packages.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("scenarios", nargs="?", help="JSON / JSON Lines package file")
+    source.add_argument("--grid", help="comma-separated levels for a full factorial, e.g. 0,50,100")
+    parser.add_argument("out_dir", help="output directory (reuse it to resume)")
+    parser.add_argument("--cities", help="comma-separated city keys (default: all)")
+    parser.add_argument("--years", default=",".join(map(str, DEFAULT_YEARS)),
+                        help="trajectory years to store (default: %(default)s)")
+    parser.add_argument("--shard-size", type=int, default=50, help="packages per shard (default: %(default)s)")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--simulate-mobility", action="store_true",
+                        help="take mobility KPI lifts from mobility_sim")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format="%(asctime)s %(message)s")
+    scenarios = (
+        grid_scenarios([float(v) for v in args.grid.split(",")]) if args.grid else load_scenarios(args.scenarios)
+    )
+    cities = args.cities.split(",") if args.cities else None
+    unknown = set(cities or ()) - set(CITY_DATA)
+    if unknown:
+        sys.exit(f"unknown cities: {', '.join(sorted(unknown))}")
+    years = tuple(int(y) for y in args.years.split(","))
+    if not all(YEARS[0] <= y <= YEARS[-1] for y in years):
+        sys.exit(f"--years must lie within {YEARS[0]}-{YEARS[-1]}")
+    try:
+        result = run(scenarios, args.out_dir, cities=cities, years=years, shard_size=args.shard_size,
+                     jobs=args.jobs, simulate_mobility=args.simulate_mobility)
+    except KeyboardInterrupt:
+        sys.exit("interrupted; rerun the same command to resume")
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
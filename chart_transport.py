@@ -0,0 +1,74 @@
+"""Compact transport for Plotly figures rendered by `visuals/chart_host.html`.
+
+Numeric trace arrays travel as base64 typed arrays (`{"dtype", "bdata"}`, which
+plotly.js >= 2.28 decodes natively). Everything except those arrays — layout,
+styling, trace types — is hashed into a signature; while the signature is
+unchanged only a "patch" with the per-trace arrays is sent, otherwise a full
+"render".
+"""
+
+import base64
+import hashlib
+import json
+
+NUMERIC_KEYS = ("x", "y", "r", "theta")
+
+
+def encode_array(values, dtype: str = "f4") -> dict:
+    """Little-endian typed-array spec; float32 is plenty for on-screen values."""
+    import numpy as np
+
+    arr = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder("<"))
+    return {"dtype": dtype, "bdata": base64.b64encode(arr.tobytes()).decode("ascii")}
+
+
+def _decode_array(spec: dict):
+    import numpy as np
+
+    return np.frombuffer(base64.b64decode(spec["bdata"]), dtype=np.dtype(spec["dtype"]).newbyteorder("<"))
+
+
+def _is_numeric(values) -> bool:
+    import numpy as np
+
+    if isinstance(values, (dict, str)):
+        return False
+    try:
+        return np.asarray(values).dtype.kind in "iuf"
+    except (TypeError, ValueError):
+        return False
+
+
+def figure_parts(fig):
+    """(traces, layout) as JSON-ready dicts with typed-array numeric data."""
+    spec = fig.to_plotly_json()
+    traces = []
+    for trace in spec.get("data", []):
+        trace = dict(trace)
+        for key in NUMERIC_KEYS:
+            if key not in trace:
+                continue
+            value = trace[key]
+            if isinstance(value, dict) and "bdata" in value and not value.get("shape"):
+                value = _decode_array(value)  # plotly's own f8 encoding -> f4
+            if _is_numeric(value):
+                trace[key] = encode_array(value)
+        traces.append(trace)
+    return traces, spec.get("layout", {})
+
+
+def figure_signature(traces, layout, config=None) -> str:
+    """Hash of everything a data-only patch cannot change."""
+    shape = [{k: v for k, v in t.items() if k not in NUMERIC_KEYS} for t in traces]
+    raw = json.dumps([shape, layout, config], sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def build_message(fig, previous_signature=None, config=None):
+    """Return (message, signature): a patch if `previous_signature` still holds."""
+    traces, layout = figure_parts(fig)
+    signature = figure_signature(traces, layout, config)
+    if signature == previous_signature:
+        patch = [{k: t[k] for k in NUMERIC_KEYS if k in t} for t in traces]
+        return {"action": "patch", "traces": patch}, signature
+    return {"action": "render", "data": traces, "layout": layout, "config": config or {}}, signature
@@ -0,0 +1,254 @@
+"""Tiered, size-bounded cache for geocodes and city geometry.
+
+Tier 1 is a per-process LRU bounded by bytes. Tier 2 is a content-addressed
+store on disk (`<objects_dir>/<sha1[:2]>/<sha1>.json`) with a SQLite index
+mapping (kind, key) -> blob digest, size, expiry and last access. SQLite
+(WAL mode) makes the index safe for many worker processes; blobs are written
+to a temp file, fsynced and renamed before their index row is committed, so a
+crash leaves at worst an unreferenced blob for `gc()` to collect.
+
+    python city_cache.py stats
+    python city_cache.py gc
+"""
+
+import collections
+import hashlib
+import json
+import os
+import pathlib
+import sqlite3
+import sys
+import threading
+import time
+
+DAY_S = 24 * 3600
+ATIME_REFRESH_S = 60.0  # a memory hit rewrites its entry's index atime at most this often
+GC_GRACE_S = 3600.0     # gc() leaves blobs and temp files younger than this (writes in flight)
+
+
+class TieredCache:
+    def __init__(self, index_path, objects_dir, *, max_bytes: int, ttl_s: dict,
+                 memory_bytes: int = 64 * 1024 * 1024):
+        self.index_path = pathlib.Path(index_path)
+        self.objects_dir = pathlib.Path(objects_dir)
+        self.max_bytes = max_bytes
+        self.ttl_s = dict(ttl_s)
+        self.memory_bytes = memory_bytes
+        self._memory = collections.OrderedDict()  # (kind, key) -> (digest, value, size, expires, touched)
+        self._memory_used = 0
+        self._lock = threading.Lock()
+        self._db = None
+
+    # ------------------------------------------------------------------
+    # storage plumbing
+    # ------------------------------------------------------------------
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.index_path, timeout=30, check_same_thread=False,
+                                 isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " kind TEXT NOT NULL, key TEXT NOT NULL, digest TEXT NOT NULL,"
+                " size INTEGER NOT NULL, expires REAL NOT NULL, atime REAL NOT NULL,"
+                " PRIMARY KEY (kind, key))"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS entries_atime ON entries (atime)")
+            db.execute("CREATE INDEX IF NOT EXISTS entries_digest ON entries (digest)")
+            self._db = db
+        return self._db
+
+    def blob_path(self, digest: str) -> pathlib.Path:
+        return self.objects_dir / digest[:2] / f"{digest}.json"
+
+    def _write_blob(self, data: bytes) -> str:
+        digest = hashlib.sha1(data).hexdigest()
+        path = self.blob_path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f".{digest}.{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp, "wb") as fh:
+                fh.write(data)
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.replace(tmp, path)
+        return digest
+
+    def _remember(self, mem_key, digest, value, size, expires) -> None:
+        if size > self.memory_bytes:
+            return
+        old = self._memory.pop(mem_key, None)
+        if old is not None:
+            self._memory_used -= old[2]
+        self._memory[mem_key] = (digest, value, size, expires, time.time())
+        self._memory_used += size
+        while self._memory_used > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= evicted[2]
+
+    def _touch(self, mem_key, now: float) -> None:
+        self._conn().execute("UPDATE entries SET atime = ? WHERE kind = ? AND key = ?", (now, *mem_key))
+
+    def _forget(self, mem_key) -> None:
+        old = self._memory.pop(mem_key, None)
+        if old is not None:
+            self._memory_used -= old[2]
+
+    # ------------------------------------------------------------------
+    # public API
+    # ------------------------------------------------------------------
+
+    def _lookup(self, kind: str, key: str, load: bool):
+        """(digest, value-or-None) for a live entry, or None."""
+        mem_key = (kind, key)
+        now = time.time()
+        with self._lock:
+            hit = self._memory.get(mem_key)
+            if hit is not None:
+                if hit[3] > now and (load or self.blob_path(hit[0]).exists()):
+                    self._memory.move_to_end(mem_key)
+                    if now - hit[4] > ATIME_REFRESH_S:
+                        self._touch(mem_key, now)
+                        self._memory[mem_key] = hit[:4] + (now,)
+                    return hit[0], hit[1]
+                self._forget(mem_key)
+
+            row = self._conn().execute(
+                "SELECT digest, size, expires FROM entries WHERE kind = ? AND key = ?", mem_key
+            ).fetchone()
+            if row is None or row[2] <= now:
+                return None
+            digest, size, expires = row
+            try:
+                value = json.loads(self.blob_path(digest).read_bytes()) if load else None
+            except (OSError, ValueError):
+                return None  # blob evicted by another process or torn; treat as a miss
+            self._touch(mem_key, now)
+            if load:
+                self._remember(mem_key, digest, value, size, expires)
+            elif not self.blob_path(digest).exists():
+                return None
+            return digest, value
+
+    def get(self, kind: str, key: str):
+        hit = self._lookup(kind, key, load=True)
+        return None if hit is None else hit[1]
+
+    def locate(self, kind: str, key: str):
+        """Blob digest of a live entry without loading it (for serving by URL)."""
+        hit = self._lookup(kind, key, load=False)
+        return None if hit is None else hit[0]
+
+    def put(self, kind: str, key: str, value) -> str:
+        data = json.dumps(value, separators=(",", ":")).encode("utf-8")
+        now = time.time()
+        expires = now + self.ttl_s.get(kind, DAY_S)
+        digest = self._write_blob(data)
+        with self._lock:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO entries (kind, key, digest, size, expires, atime)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, key, digest, len(data), expires, now),
+            )
+            self._remember((kind, key), digest, value, len(data), expires)
+        self.evict()
+        return digest
+
+    def keys(self, kind: str) -> list:
+        """Keys of the live entries of `kind`."""
+        with self._lock:
+            rows = self._conn().execute(
+                "SELECT key FROM entries WHERE kind = ? AND expires > ? ORDER BY key", (kind, time.time())
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            row = self._conn().execute(
+                "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM entries)"
+            ).fetchone()
+        return int(row[0])
+
+    def evict(self) -> None:
+        """Drop expired entries, then least-recently-used ones until under max_bytes."""
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                doomed = db.execute("SELECT kind, key, digest FROM entries WHERE expires <= ?", (now,)).fetchall()
+                db.execute("DELETE FROM entries WHERE expires <= ?", (now,))
+                total = db.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT digest, size FROM entries)"
+                ).fetchone()[0]
+                if total > self.max_bytes:
+                    for kind, key, digest, size in db.execute(
+                        "SELECT kind, key, digest, size FROM entries ORDER BY atime"
+                    ).fetchall():
+                        if total <= self.max_bytes:
+                            break
+                        db.execute("DELETE FROM entries WHERE kind = ? AND key = ?", (kind, key))
+                        doomed.append((kind, key, digest))
+                        if db.execute("SELECT 1 FROM entries WHERE digest = ?", (digest,)).fetchone() is None:
+                            total -= size
+                orphans = {
+                    digest for _, _, digest in doomed
+                    if db.execute("SELECT 1 FROM entries WHERE digest = ?", (digest,)).fetchone() is None
+                }
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            for kind, key, _ in doomed:
+                self._forget((kind, key))
+        for digest in orphans:
+            self.blob_path(digest).unlink(missing_ok=True)
+
+    def gc(self) -> int:
+        """Remove blobs (and abandoned temp files) no index row references.
+
+        Files younger than GC_GRACE_S are left alone: another process may have
+        written the blob and not committed its index row yet, or still be
+        writing the temp file it is about to rename.
+        """
+        cutoff = time.time() - GC_GRACE_S
+        with self._lock:
+            live = {row[0] for row in self._conn().execute("SELECT DISTINCT digest FROM entries")}
+        removed = 0
+        for path in self.objects_dir.glob("*/*"):
+            try:
+                if path.stat().st_mtime > cutoff:
+                    continue
+            except OSError:
+                continue  # renamed or removed meanwhile
+            if path.suffix == ".tmp" or path.name.split(".")[0] not in live:
+                path.unlink(missing_ok=True)
+                removed += 1
+        return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._conn().execute(
+                "SELECT kind, COUNT(*), SUM(size) FROM entries GROUP BY kind"
+            ).fetchall()
+        return {
+            "kinds": {kind: {"entries": count, "bytes": size} for kind, count, size in rows},
+            "total_bytes": self.total_bytes(),
+            "max_bytes": self.max_bytes,
+            "memory_bytes": self._memory_used,
+        }
+
+
+if __name__ == "__main__":
+    import geodata
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command == "stats":
+        print(json.dumps(geodata.CACHE.stats(), indent=2))
+    elif command == "gc":
+        print(f"removed {geodata.CACHE.gc()} unreferenced blobs")
+    else:
+        sys.exit("usage: python city_cache.py stats|gc")
@@ -0,0 +1,38 @@
+"""Shape-preserving downsampling for chart series."""
+
+
+def lttb(x, y, n_out: int):
+    """Largest-Triangle-Three-Buckets: keep `n_out` points that preserve the
+    visual shape of (x, y). First and last points are always kept; series that
+    already fit are returned unchanged (as float arrays).
+    """
+    import numpy as np
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+
+    # n_out - 2 interior buckets over points 1..n-2; the last "next bucket" is the end point
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+    next_lo = edges[1:]
+    next_hi = np.append(edges[2:], n)
+    counts = next_hi - next_lo
+    csum_x = np.concatenate(([0.0], np.cumsum(x)))
+    csum_y = np.concatenate(([0.0], np.cumsum(y)))
+    next_x = (csum_x[next_hi] - csum_x[next_lo]) / counts
+    next_y = (csum_y[next_hi] - csum_y[next_lo]) / counts
+
+    keep = np.empty(n_out, dtype=np.intp)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs(
+            (x[a] - next_x[i]) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (next_y[i] - y[a])
+        )
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return x[keep], y[keep]
@@ -0,0 +1,209 @@
+"""Server-side geocoding and OSM geometry for the 3D city viewer.
+
+Mirrors the browser-side `geocodeCity` / `fetchOverpass` in
+`visuals/city_test.html` so the server can warm a city before the viewer asks
+for it. Results live in a `city_cache.TieredCache`: geocodes as [lon, lat],
+geometry trimmed to the fields the viewer reads. Geometry blobs sit under
+`static/cache/`, so the iframe fetches them by content hash instead of hitting
+Overpass.
+
+Set `URBAN_PERF_OSM_BASE` to point Photon and Overpass, here and in the
+viewer, at the record/replay stand-in in `osm_standin.py`.
+"""
+
+import json
+import math
+import os
+import pathlib
+import threading
+import urllib.parse
+import urllib.request
+import weakref
+
+from city_cache import DAY_S, TieredCache
+
+PUBLIC_PHOTON_URL = "https://photon.komoot.io/api/"
+PUBLIC_OVERPASS_ENDPOINTS = (
+    "https://overpass-api.de/api/interpreter",
+    "https://overpass.kumi.systems/api/interpreter",
+)
+# routes of the stand-in server, relative to URBAN_PERF_OSM_BASE
+OSM_BASE_ENV = "URBAN_PERF_OSM_BASE"
+STANDIN_PHOTON_PATH = "/photon/api/"
+STANDIN_OVERPASS_PATH = "/overpass/api/interpreter"
+
+_osm_base = os.environ.get(OSM_BASE_ENV, "").rstrip("/")
+PHOTON_URL = _osm_base + STANDIN_PHOTON_PATH if _osm_base else PUBLIC_PHOTON_URL
+OVERPASS_ENDPOINTS = (_osm_base + STANDIN_OVERPASS_PATH,) if _osm_base else PUBLIC_OVERPASS_ENDPOINTS
+REQUEST_TIMEOUT_S = 25
+USER_AGENT = "UrbanPerformance/1.0"
+
+CACHE = TieredCache(
+    index_path=pathlib.Path(".city_cache/index.sqlite3"),
+    objects_dir=pathlib.Path("static/cache"),
+    max_bytes=512 * 1024 * 1024,
+    ttl_s={"geocode": 30 * DAY_S, "geometry": 7 * DAY_S},
+)
+CACHE_URL_PREFIX = "app/static/cache"
+
+# Only these way tags are read by buildCity(); everything else is dropped.
+WAY_TAGS = ("highway", "building", "levels", "building:levels", "height")
+
+_key_locks = weakref.WeakValueDictionary()  # entries go once no caller holds the lock
+_key_locks_guard = threading.Lock()
+
+
+def _key_lock(key: str) -> threading.Lock:
+    """One lock per cache key so concurrent warmers wait instead of refetching."""
+    with _key_locks_guard:
+        lock = _key_locks.get(key)
+        if lock is None:
+            lock = _key_locks[key] = threading.Lock()
+        return lock
+
+
+def _normalize_query(query: str) -> str:
+    return " ".join((query or "").lower().split())
+
+
+def geometry_key(center, area_km: float) -> str:
+    lon, lat = center
+    return f"{lon:.6f},{lat:.6f},{float(area_km):.3f}"
+
+
+def geometry_url(digest: str) -> str:
+    return f"{CACHE_URL_PREFIX}/{digest[:2]}/{digest}.json"
+
+
+def viewer_endpoints() -> dict:
+    """Photon/Overpass URLs for the viewer config, when they are overridden."""
+    if not _osm_base:
+        return {}
+    return {"photonUrl": PHOTON_URL, "overpassEndpoints": list(OVERPASS_ENDPOINTS)}
+
+
+def _http_json(url: str, data: bytes = None, headers: dict = None):
+    req_headers = {"User-Agent": USER_AGENT}
+    req_headers.update(headers or {})
+    request = urllib.request.Request(url, data=data, headers=req_headers)
+    with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT_S) as response:
+        return json.load(response)
+
+
+# ============================================================================
+# GEOCODING
+# ============================================================================
+
+def geocode_city(query: str):
+    """Return the (lon, lat) Photon picks for `query`."""
+    key = _normalize_query(query)
+    if not key:
+        raise ValueError("Empty city query")
+    with _key_lock(f"geocode:{key}"):
+        cached = CACHE.get("geocode", key)
+        if cached is not None:
+            return tuple(cached)
+        url = f"{PHOTON_URL}?{urllib.parse.urlencode({'q': query, 'limit': 1})}"
+        payload = _http_json(url)
+        features = payload.get("features") or []
+        if not features:
+            raise LookupError(f"Place not found: {query}")
+        lon, lat = features[0]["geometry"]["coordinates"][:2]
+        CACHE.put("geocode", key, [float(lon), float(lat)])
+        return float(lon), float(lat)
+
+
+# ============================================================================
+# OVERPASS GEOMETRY
+# ============================================================================
+
+def overpass_query(center, area_km: float) -> str:
+    """Same bbox and filters as `fetchOverpass` in the viewer."""
+    lon, lat = center
+    d_lat = area_km / 110.574
+    d_lon = area_km / (111.320 * math.cos(math.radians(lat)))
+    bbox = f"{lat - d_lat},{lon - d_lon},{lat + d_lat},{lon + d_lon}"
+    return (
+        "[out:json][timeout:25];"
+        f'(way["building"]({bbox});relation["building"]({bbox}););'
+        "out body; >; out skel qt;"
+        f'(way["highway"]["highway"!~"footway|path|track|service"]({bbox});'
+        "); out body; >; out skel qt;"
+    )
+
+
+def trim_overpass(payload: dict) -> dict:
+    """Keep only nodes (id/lon/lat) and ways (id/nodes/used tags)."""
+    elements = []
+    for el in payload.get("elements", []):
+        kind = el.get("type")
+        if kind == "node":
+            elements.append({"type": "node", "id": el["id"], "lon": el["lon"], "lat": el["lat"]})
+        elif kind == "way":
+            tags = el.get("tags") or {}
+            kept = {k: tags[k] for k in WAY_TAGS if k in tags}
+            way = {"type": "way", "id": el["id"], "nodes": el.get("nodes", [])}
+            if kept:
+                way["tags"] = kept
+            elements.append(way)
+    return {"elements": elements}
+
+
+def fetch_overpass(center, area_km: float) -> dict:
+    query = overpass_query(center, area_km).encode("utf-8")
+    last_err = None
+    for url in OVERPASS_ENDPOINTS:
+        try:
+            return _http_json(url, data=query, headers={"Content-Type": "text/plain"})
+        except Exception as exc:  # try the next mirror
+            last_err = exc
+    raise last_err or RuntimeError("Overpass failed")
+
+
+def fetch_geometry(center, area_km: float) -> str:
+    """Fetch and trim the geometry unless cached; returns the viewer-relative URL."""
+    key = geometry_key(center, area_km)
+    with _key_lock(f"geometry:{key}"):
+        digest = CACHE.locate("geometry", key)
+        if digest is None:
+            digest = CACHE.put("geometry", key, trim_overpass(fetch_overpass(center, area_km)))
+        return geometry_url(digest)
+
+
+# ============================================================================
+# CITY LOOKUPS
+# ============================================================================
+
+def warm_city(query: str, area_km: float) -> dict:
+    """Blocking: make sure both the center and the geometry are cached."""
+    center = geocode_city(query)
+    return {"center": list(center), "geometryUrl": fetch_geometry(center, area_km)}
+
+
+def peek_city(query: str, area_km: float) -> dict:
+    """Non-blocking: whatever is already warm for this city, possibly empty."""
+    center = CACHE.get("geocode", _normalize_query(query))
+    if center is None:
+        return {}
+    warm = {"center": list(center)}
+    digest = CACHE.locate("geometry", geometry_key(center, area_km))
+    if digest is not None:
+        warm["geometryUrl"] = geometry_url(digest)
+    return warm
+
+
+def cached_geometry(query: str, area_km: float):
+    """Non-blocking: (center, digest) of cached geometry for this city, or None."""
+    center = CACHE.get("geocode", _normalize_query(query))
+    if center is None:
+        return None
+    digest = CACHE.locate("geometry", geometry_key(center, area_km))
+    return None if digest is None else (tuple(center), digest)
+
+
+def load_geometry(digest: str):
+    """Trimmed geometry by the content digest `cached_geometry` returned (never fetches), or None."""
+    try:
+        return json.loads(CACHE.blob_path(digest).read_bytes())
+    except (OSError, ValueError):
+        return None
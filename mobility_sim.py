@@ -0,0 +1,444 @@
+"""Vectorized agent mobility simulation feeding the mobility KPIs.
+
+A city's road network (trimmed Overpass geometry from `geodata`, or a
+synthetic street grid when none is cached) is reduced once to NumPy arrays:
+a CSR adjacency, trip-generation weights from building footprints, a grid of
+zones with a shortest-path tree to each zone's centre node, and the walking
+distance to the nearest of a lattice of transit hubs. Per scenario, thousands
+of agents pick a mode with a multinomial logit over their routed network
+distances, whose utilities respond to the `active_mobility` /
+`public_transit` intensities, then advance together tick by tick down their
+trees as array operations while their positions are binned into a flow grid.
+Mode shares and zone-level gravity accessibility come from those same trips.
+"""
+
+import heapq
+import math
+import zlib
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+
+import geodata
+
+EARTH_R = 6378137.0
+MODES = ("walk", "bike", "transit", "car")
+SUSTAINABLE = np.array([True, True, True, False])
+SPEED_M_PER_MIN = np.array([80.0, 250.0, 370.0, 420.0])
+BASE_ASC = np.array([0.0, -1.2, -0.6, 0.9])   # alternative-specific constants
+TIME_BETA = -0.09                             # utility per minute
+TRANSIT_WAIT_MIN = 8.0
+CAR_PARKING_MIN = 4.0
+
+N_AGENTS = 4000
+N_TICKS = 60          # one-minute ticks
+N_HUBS = 16
+FLOW_GRID = 48
+ZONE_GRID = 10        # zone centres are the routing sources: one shortest-path tree each
+ACCESS_DECAY_MIN = 10.0   # gravity decay of opportunities with travel time
+
+
+@dataclass(frozen=True)
+class RoadNetwork:
+    xy: np.ndarray          # (n_nodes, 2) metres, city centre at the origin
+    weight: np.ndarray      # (n_nodes,) trip generation weight, 0 off the main component
+    indptr: np.ndarray      # CSR adjacency: neighbours of u are indices[indptr[u]:indptr[u + 1]]
+    indices: np.ndarray
+    length: np.ndarray      # edge lengths, metres
+    zone: np.ndarray        # (n_nodes,) zone per node, -1 off the main component
+    zone_node: np.ndarray   # (n_zones,) node each zone's trips start and end at
+    zone_weight: np.ndarray # (n_zones,) opportunities (summed node weight) per zone
+    zone_dist: np.ndarray   # (n_zones, n_nodes) network metres to the zone node
+    zone_next: np.ndarray   # (n_zones, n_nodes) next node on the shortest path to it
+    stop_dist: np.ndarray   # (n_nodes,) network metres to the nearest transit hub
+    extent: float           # half-width of the simulated square, metres
+
+
+@dataclass(frozen=True)
+class MobilityResult:
+    mode_share: dict                # mode -> share of simulated trips
+    sustainable_share: float
+    accessibility_mean: float       # decay-weighted share of opportunities, 0..1
+    accessibility_gini: float
+    accessibility_index: float      # mean * (1 - gini)
+    flows: np.ndarray               # (len(MODES), FLOW_GRID, FLOW_GRID) agent-minutes
+    mean_trip_min: float
+
+
+# ============================================================================
+# NETWORK PREPARATION (once per city)
+# ============================================================================
+
+def _project(lon, lat, lon0, lat0):
+    x = EARTH_R * np.radians(lon - lon0) * math.cos(math.radians(lat0))
+    z = EARTH_R * np.radians(lat - lat0)
+    return np.stack([x, z], axis=-1)
+
+
+def _nearest(points: np.ndarray, targets: np.ndarray, budget: int = 2_000_000) -> np.ndarray:
+    """Index of the nearest target for each point.
+
+    Rows per chunk are sized from len(targets) so one chunk's distance matrix
+    stays at `budget` entries (~16 MB) however large the road network is.
+    """
+    out = np.empty(len(points), dtype=np.intp)
+    chunk = max(1, budget // max(1, len(targets)))
+    t2 = (targets ** 2).sum(axis=1)
+    for start in range(0, len(points), chunk):
+        block = points[start:start + chunk]
+        # |p - t|^2 without the (rows, targets, 2) difference array; |p|^2 is constant per row
+        d2 = t2[None, :] - 2.0 * (block @ targets.T)
+        out[start:start + chunk] = d2.argmin(axis=1)
+    return out
+
+
+def _csr(n: int, edges: np.ndarray, lengths: np.ndarray):
+    """Undirected edge list -> (indptr, indices, length)."""
+    a = np.concatenate([edges[:, 0], edges[:, 1]])
+    b = np.concatenate([edges[:, 1], edges[:, 0]])
+    order = np.argsort(a, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.intp)
+    indptr[1:] = np.cumsum(np.bincount(a, minlength=n))
+    return indptr, b[order], np.concatenate([lengths, lengths])[order]
+
+
+def _simplify(n: int, edges: np.ndarray, lengths: np.ndarray):
+    """Merge chains of degree-2 shape nodes into single edges.
+
+    Returns the kept node indices (intersections and dead ends) and the edges
+    and lengths between them; routing cost then scales with intersections.
+    """
+    indptr, indices, length = (a.tolist() for a in _csr(n, edges, lengths))
+    keep = [indptr[u + 1] - indptr[u] != 2 for u in range(n)]
+    merged, merged_len = [], []
+    for u in range(n):
+        if not keep[u]:
+            continue
+        for k in range(indptr[u], indptr[u + 1]):
+            prev, v, total = u, indices[k], length[k]
+            while not keep[v]:
+                a = indptr[v]
+                k2 = a if indices[a] != prev else a + 1
+                prev, v, total = v, indices[k2], total + length[k2]
+            if u < v:  # each chain is walked from both ends; keep one
+                merged.append((u, v))
+                merged_len.append(total)
+    kept = np.flatnonzero(keep)
+    remap = np.full(n, -1, dtype=np.intp)
+    remap[kept] = np.arange(len(kept))
+    return kept, remap[np.array(merged, dtype=np.intp).reshape(-1, 2)], np.array(merged_len)
+
+
+def _dijkstra(adjacency, n: int, sources):
+    """Network metres to the nearest source and the next hop toward it, per node."""
+    indptr, indices, length = adjacency
+    dist = [math.inf] * n
+    nxt = [-1] * n
+    heap = []
+    for s in sources:
+        dist[s], nxt[s] = 0.0, s
+        heap.append((0.0, s))
+    heapq.heapify(heap)
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        for k in range(indptr[u], indptr[u + 1]):
+            v, nd = indices[k], d + length[k]
+            if nd < dist[v]:
+                dist[v], nxt[v] = nd, u
+                heapq.heappush(heap, (nd, v))
+    return dist, nxt
+
+
+def _main_component(adjacency, n: int) -> np.ndarray:
+    """Mask of the largest connected component (OSM extracts leave fragments)."""
+    indptr, indices, _ = adjacency
+    label = [-1] * n
+    sizes = []
+    for root in range(n):
+        if label[root] >= 0:
+            continue
+        label[root] = len(sizes)
+        stack, size = [root], 0
+        while stack:
+            u = stack.pop()
+            size += 1
+            for v in indices[indptr[u]:indptr[u + 1]]:
+                if label[v] < 0:
+                    label[v] = label[root]
+                    stack.append(v)
+        sizes.append(size)
+    return np.array(label) == int(np.argmax(sizes))
+
+
+def _prepare(xy: np.ndarray, edges: np.ndarray, lengths: np.ndarray, weight: np.ndarray,
+             extent: float) -> RoadNetwork:
+    """Zones, shortest-path trees to every zone node and stop distances for a street graph."""
+    n = len(xy)
+    indptr, indices, length = _csr(n, edges, lengths)
+    adjacency = (indptr.tolist(), indices.tolist(), length.tolist())
+
+    main = _main_component(adjacency, n)
+    weight = np.where(main, weight, 0.0)
+    bins = np.linspace(-extent, extent, ZONE_GRID + 1)
+    ix = np.clip(np.searchsorted(bins, xy[:, 0]) - 1, 0, ZONE_GRID - 1)
+    iz = np.clip(np.searchsorted(bins, xy[:, 1]) - 1, 0, ZONE_GRID - 1)
+    cell = np.where(main, iz * ZONE_GRID + ix, -1)
+    live = np.unique(cell[cell >= 0])
+    zone = np.where(main, np.searchsorted(live, cell), -1)
+
+    # each zone's trips start and end at its node nearest the weighted centroid
+    zone_node = np.empty(len(live), dtype=np.intp)
+    for z in range(len(live)):
+        members = np.flatnonzero(zone == z)
+        w = weight[members]
+        centre = np.average(xy[members], axis=0, weights=w if w.sum() > 0 else None)
+        zone_node[z] = members[_nearest(centre[None, :], xy[members])[0]]
+
+    zone_dist = np.empty((len(live), n), dtype=np.float32)
+    zone_next = np.empty((len(live), n), dtype=np.int32)
+    for z, source in enumerate(zone_node.tolist()):
+        zone_dist[z], zone_next[z] = _dijkstra(adjacency, n, [source])
+
+    side = int(math.sqrt(N_HUBS))
+    ticks = np.linspace(-extent, extent, side + 2)[1:-1]
+    lattice = np.stack(np.meshgrid(ticks, ticks), axis=-1).reshape(-1, 2)
+    candidates = np.flatnonzero(main)
+    hubs = candidates[_nearest(lattice, xy[candidates])]  # snap stops onto the street network
+    stop_dist, _ = _dijkstra(adjacency, n, set(hubs.tolist()))
+
+    return RoadNetwork(
+        xy, weight, indptr, indices, length, zone, zone_node,
+        np.bincount(zone[main], weights=weight[main], minlength=len(live)),
+        zone_dist, zone_next, np.array(stop_dist), extent,
+    )
+
+
+def network_from_overpass(geometry: dict, center, area_km: float):
+    """RoadNetwork from trimmed Overpass JSON; None if it holds no usable roads."""
+    nodes = {}
+    roads, buildings = [], []
+    for el in geometry.get("elements", []):
+        if el["type"] == "node":
+            nodes[el["id"]] = (el["lon"], el["lat"])
+        elif el["type"] == "way":
+            tags = el.get("tags", {})
+            if "highway" in tags:
+                roads.append(el["nodes"])
+            elif "building" in tags:
+                buildings.append(el["nodes"])
+
+    road_ids = sorted({nid for way in roads for nid in way if nid in nodes})
+    if len(road_ids) < 2:
+        return None
+    index = {nid: i for i, nid in enumerate(road_ids)}
+    lonlat = np.array([nodes[nid] for nid in road_ids])
+    xy = _project(lonlat[:, 0], lonlat[:, 1], *center)
+    edges = np.array(
+        [(index[a], index[b]) for way in roads for a, b in zip(way, way[1:]) if a in index and b in index],
+        dtype=np.intp,
+    ).reshape(-1, 2)
+    if len(edges) == 0:
+        return None
+    kept, edges, lengths = _simplify(len(xy), edges, np.hypot(*(xy[edges[:, 0]] - xy[edges[:, 1]]).T))
+    if len(edges) == 0:
+        return None
+    xy = xy[kept]
+
+    weight = np.ones(len(xy))
+    footprints = [[nodes[n] for n in way if n in nodes] for way in buildings]
+    footprints = [f for f in footprints if len(f) >= 3]
+    if footprints:
+        centroids = np.array([np.mean(f, axis=0) for f in footprints])
+        snapped = _nearest(_project(centroids[:, 0], centroids[:, 1], *center), xy)
+        weight += np.bincount(snapped, minlength=len(xy))
+
+    return _prepare(xy, edges, lengths, weight, area_km * 1000.0)
+
+
+def synthetic_network(area_km: float, block_m: float = 120.0) -> RoadNetwork:
+    """Street grid stand-in used until the real geometry is cached."""
+    extent = area_km * 1000.0
+    ticks = np.arange(-extent, extent + 1e-9, block_m)
+    side = len(ticks)
+    xy = np.stack(np.meshgrid(ticks, ticks), axis=-1).reshape(-1, 2)
+    grid = np.arange(side * side).reshape(side, side)
+    edges = np.concatenate([
+        np.stack([grid[:, :-1].ravel(), grid[:, 1:].ravel()], axis=-1),
+        np.stack([grid[:-1, :].ravel(), grid[1:, :].ravel()], axis=-1),
+    ])
+    # denser toward the centre, like most cores
+    weight = 1.0 + 4.0 * np.exp(-(np.hypot(*xy.T) / (0.5 * extent)) ** 2)
+    return _prepare(xy, edges, np.full(len(edges), block_m), weight, extent)
+
+
+# ============================================================================
+# SCENARIO SIMULATION
+# ============================================================================
+
+def _mode_times(dist_m, access_m, active: float, transit: float) -> np.ndarray:
+    """(len(MODES), n) door-to-door minutes."""
+    walk = dist_m / SPEED_M_PER_MIN[0]
+    bike = dist_m / SPEED_M_PER_MIN[1] * (1.0 - 0.25 * active)       # connectivity / safety
+    transit_t = (
+        access_m / SPEED_M_PER_MIN[0] * (1.0 - 0.5 * transit)           # coverage
+        + TRANSIT_WAIT_MIN * (1.0 - 0.5 * transit)                       # frequency
+        + dist_m / SPEED_M_PER_MIN[2]
+    )
+    car = dist_m / SPEED_M_PER_MIN[3] + CAR_PARKING_MIN
+    return np.stack([walk, bike, transit_t, car])
+
+
+def _choice_probabilities(times: np.ndarray, active: float, transit: float) -> np.ndarray:
+    asc = BASE_ASC + np.array([0.8 * active, 1.5 * active, 1.2 * transit, 0.0])
+    utility = asc[:, None] + TIME_BETA * times
+    utility -= utility.max(axis=0, keepdims=True)
+    expu = np.exp(utility)
+    return expu / expu.sum(axis=0, keepdims=True)
+
+
+def _gini(values: np.ndarray, weights: np.ndarray) -> float:
+    order = np.argsort(values)
+    v, w = values[order], weights[order]
+    cum_w = np.cumsum(w) / w.sum()
+    cum_vw = np.cumsum(v * w)
+    if cum_vw[-1] <= 0:
+        return 0.0
+    lorenz = cum_vw / cum_vw[-1]
+    prev = np.concatenate(([0.0], lorenz[:-1]))
+    return float(1.0 - np.sum(np.diff(np.concatenate(([0.0], cum_w))) * (lorenz + prev)))
+
+
+def simulate(network: RoadNetwork, active: float, transit: float, *, seed: int = 0,
+             n_agents: int = N_AGENTS, n_ticks: int = N_TICKS) -> MobilityResult:
+    """One scenario; `active` / `transit` are intervention intensities in 0..1.
+
+    Each agent travels from a building-weighted street node to a zone drawn by
+    its opportunities, along the shortest path in that zone's tree. Mode
+    shares are the agents' sampled choices; accessibility is averaged over
+    the same routed trips.
+    """
+    rng = np.random.default_rng(seed)
+    origin = rng.choice(len(network.xy), size=n_agents, p=network.weight / network.weight.sum())
+    dest = rng.choice(len(network.zone_node), size=n_agents, p=network.zone_weight / network.zone_weight.sum())
+    trip_m = network.zone_dist[dest, origin].astype(float)
+    access = network.stop_dist[origin] + network.stop_dist[network.zone_node[dest]]
+
+    times = _mode_times(trip_m, access, active, transit)
+    probs = _choice_probabilities(times, active, transit)
+
+    # sample a mode per agent (inverse CDF on the per-agent probabilities)
+    u = rng.random(n_agents)
+    mode = (u[None, :] > np.cumsum(probs, axis=0)).sum(axis=0).clip(0, len(MODES) - 1)
+    trip_min = times[mode, np.arange(n_agents)]
+    depart = rng.uniform(0, n_ticks / 2, size=n_agents)
+
+    # advance every agent each tick along its route; bin positions into the flow grid
+    flows = np.zeros(len(MODES) * FLOW_GRID * FLOW_GRID)
+    scale = FLOW_GRID / (2.0 * network.extent)
+    at = origin.copy()
+    for tick in range(n_ticks):
+        progress = (tick - depart) / np.maximum(trip_min, 1e-6)
+        moving = np.flatnonzero((progress >= 0.0) & (progress <= 1.0))
+        if not len(moving):
+            continue
+        # step each agent down its tree until no more than the metres still to go remain
+        step, left = moving, trip_m[moving] * (1.0 - progress[moving])
+        while len(step):
+            ahead = network.zone_dist[dest[step], at[step]] > left
+            step, left = step[ahead], left[ahead]
+            at[step] = network.zone_next[dest[step], at[step]]
+        cell = np.clip(((network.xy[at[moving]] + network.extent) * scale).astype(np.intp), 0, FLOW_GRID - 1)
+        flat = (mode[moving] * FLOW_GRID + cell[:, 1]) * FLOW_GRID + cell[:, 0]
+        flows += np.bincount(flat, minlength=flows.size)
+
+    # gravity accessibility per home zone: destinations are drawn by opportunities,
+    # so the mean decayed time of a zone's trips by the fastest sustainable mode
+    # estimates the share of opportunities it reaches
+    reach = np.exp(-times[SUSTAINABLE].min(axis=0) / ACCESS_DECAY_MIN)
+    home = network.zone[origin]
+    count = np.bincount(home, minlength=len(network.zone_node))
+    total = np.bincount(home, weights=reach, minlength=len(network.zone_node))
+    live = count > 0
+    acc_mean = float(reach.mean())
+    acc_gini = _gini(total[live] / count[live], count[live].astype(float))
+
+    mode_share = np.bincount(mode, minlength=len(MODES)) / n_agents
+    return MobilityResult(
+        mode_share=dict(zip(MODES, mode_share.round(4).tolist())),
+        sustainable_share=float(mode_share[SUSTAINABLE].sum()),
+        accessibility_mean=acc_mean,
+        accessibility_gini=acc_gini,
+        accessibility_index=acc_mean * (1.0 - acc_gini),
+        flows=flows.reshape(len(MODES), FLOW_GRID, FLOW_GRID),
+        mean_trip_min=float(trip_min.mean()),
+    )
+
+
+def city_seed(name: str) -> int:
+    """Stable across processes (unlike hash())."""
+    return zlib.crc32(name.encode("utf-8"))
+
+
+# ============================================================================
+# CITY LOOKUPS
+# ============================================================================
+
+@lru_cache(maxsize=16)
+def _network(center, digest, area_km: float) -> RoadNetwork:
+    if digest is not None:
+        geometry = geodata.load_geometry(digest)
+        network = network_from_overpass(geometry, center, area_km) if geometry else None
+        if network is not None:
+            return network
+    return synthetic_network(area_km)
+
+
+def network_source(query: str, area_km: float) -> dict:
+    """JSON pin of the streets `city_scenario` would use now: the cached
+    geometry's center and digest, or both None for the synthetic grid."""
+    cached = geodata.cached_geometry(query, area_km)
+    return {"center": list(cached[0]), "digest": cached[1]} if cached else {"center": None, "digest": None}
+
+
+def _pinned(source: dict):
+    return (tuple(source["center"]) if source["center"] else None), source["digest"]
+
+
+def city_network(query: str, area_km: float, *, source: dict = None) -> RoadNetwork:
+    """Real streets once `geodata` has them cached, the synthetic grid until then."""
+    center, digest = _pinned(source or network_source(query, area_km))
+    return _network(center, digest, float(area_km))
+
+
+@lru_cache(maxsize=512)
+def _scenario(center, digest, area_km: float, active: float, transit: float, seed: int) -> MobilityResult:
+    return simulate(_network(center, digest, area_km), active, transit, seed=seed)
+
+
+def city_scenario(query: str, area_km: float, active: float, transit: float, *,
+                  source: dict = None) -> MobilityResult:
+    """Memoized `simulate` for a city; re-runs once real geometry lands in the cache.
+
+    `source` (from `network_source`) pins the streets instead of following the cache.
+    """
+    center, digest = _pinned(source or network_source(query, area_km))
+    return _scenario(center, digest, float(area_km), round(active, 3), round(transit, 3), city_seed(query))
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    query = sys.argv[1] if len(sys.argv) > 1 else "Boston, Massachusetts, USA"
+    area = float(sys.argv[2]) if len(sys.argv) > 2 else 1.5
+    network = city_network(query, area)
+    print(f"{query}: {len(network.xy)} nodes, {len(network.zone_node)} zones")
+    for level in (0.0, 0.5, 1.0):
+        start = time.perf_counter()
+        result = simulate(network, level, level, seed=city_seed(query))
+        ms = (time.perf_counter() - start) * 1000
+        print(f"intensity {level:.1f}: {ms:6.1f} ms  sustainable {result.sustainable_share:.3f}"
+              f"  access {result.accessibility_index:.3f}  {result.mode_share}")
@@ -0,0 +1,431 @@
+"""City catalog, intervention tables and the KPI projection model.
+
+Kept free of Streamlit so the app, the prefetcher and offline tools share one
+copy; the module (and its memoized tables) lives for the whole process instead
+of being rebuilt on every script rerun.
+"""
+
+import pathlib
+from functools import lru_cache
+
+import startup
+
+CATEGORIES = ["Economic", "Environmental", "Social"]
+
+# Projection horizon: monthly steps from Jan 2025 through Dec 2050
+YEARS = list(range(2025, 2051))
+STEPS_PER_YEAR = 12
+TARGET_YEAR = 2035  # the radar's "improved" KPIs are reached by this year
+
+
+# ============================================================================
+# DATA DEFINITIONS
+# ============================================================================
+
+CITY_DATA = {
+    "Boston": {
+        "map_query": "Boston, Massachusetts, USA",
+        "map_area_km": 2.0,
+        "kpis": [
+                    # ENVIRONMENTAL
+                    {"name": "GHG reduction",              "category": "Environmental", "value": 5.6},
+                    {"name": "Energy efficiency",          "category": "Environmental", "value": 6.2},
+                    {"name": "Sustainable mode share",     "category": "Environmental", "value": 5.0},
+                    {"name": "Waste diversion",            "category": "Environmental", "value": 4.0},
+                    # ECONOMIC
+                    {"name": "Household savings",          "category": "Economic",      "value": 5.4},
+                    {"name": "Jobs created",               "category": "Economic",      "value": 5.1},
+                    {"name": "Productivity gains",         "category": "Economic",      "value": 4.8},
+                    {"name": "Locally-owned businesses",   "category": "Economic",      "value": 5.0},
+                    # SOCIAL
+                    {"name": "Housing affordability",      "category": "Social",        "value": 4.7},
+                    {"name": "Public health",              "category": "Social",        "value": 5.5},
+                    {"name": "Equity of Accessibility",    "category": "Social",        "value": 4.9},
+                ],
+        "time_series": {
+            "economy": [98, 100, 103, 105, 108, 111, 114, 118, 121, 124, 128],
+            "environment": [152, 149, 145, 142, 138, 134, 131, 126, 122, 119, 116],
+            "health": [84, 86, 88, 90, 92, 94, 97, 99, 101, 103, 106],
+        },
+    },
+    "San Sebastian": {
+        "map_query": "Donostia-San Sebastian, Spain",
+        "map_area_km": 1.5,
+        "kpis": [
+            # ENVIRONMENTAL
+            {"name": "GHG reduction",              "category": "Environmental", "value": 4.8},
+            {"name": "Energy efficiency",          "category": "Environmental", "value": 5.4},
+            {"name": "Sustainable mode share",     "category": "Environmental", "value": 4.6},
+            {"name": "Waste diversion",            "category": "Environmental", "value": 3.6},
+            # ECONOMIC
+            {"name": "Household savings",          "category": "Economic",      "value": 4.9},
+            {"name": "Jobs created",               "category": "Economic",      "value": 4.7},
+            {"name": "Productivity gains",         "category": "Economic",      "value": 4.2},
+            {"name": "Locally-owned businesses",   "category": "Economic",      "value": 4.6},
+            # SOCIAL
+            {"name": "Housing affordability",      "category": "Social",        "value": 4.2},
+            {"name": "Public health",              "category": "Social",        "value": 4.9},
+            {"name": "Equity of Accessibility",    "category": "Social",        "value": 4.4},
+        ],
+        "time_series": {
+            "economy": [93, 95, 96, 99, 101, 103, 106, 109, 112, 114, 118],
+            "environment": [164, 161, 158, 154, 151, 147, 144, 140, 136, 133, 130],
+            "health": [79, 80, 82, 83, 85, 87, 89, 91, 93, 95, 98],
+        },
+    },
+}
+
+
+INTERVENTIONS = [
+    {
+        "id": "urban_form",
+        "label": "Urban Form",
+        "impact_weights": {"Economic": 0.45, "Environmental": 0.15, "Social": 0.40},
+        "sub_sliders": [
+            {"label": "Upzoning", "min": 0, "max": 100, "value": 0},
+            {"label": "Mixed-Use Development", "min": 0, "max": 100, "value": 0}
+        ]
+    },
+    {
+        "id": "building_efficiency",
+        "label": "Building Efficiency",
+        "impact_weights": {"Economic": 0.25, "Environmental": 0.55, "Social": 0.20},
+        "sub_sliders": [
+            {"label": "Retrofits", "min": 0, "max": 100, "value": 0},
+            {"label": "Standards", "min": 0, "max": 100, "value": 0}
+        ]
+    },
+    {
+        "id": "clean_energy",
+        "label": "Clean Energy",
+        "impact_weights": {"Economic": 0.35, "Environmental": 0.45, "Social": 0.20},
+        "sub_sliders": [
+            {"label": "Solar", "min": 0, "max": 100, "value": 0},
+            {"label": "Wind", "min": 0, "max": 100, "value": 0},
+            {"label": "Geothermal", "min": 0, "max": 100, "value": 0},
+            {"label": "Hydro", "min": 0, "max": 100, "value": 0},
+            {"label": "Nuclear", "min": 0, "max": 100, "value": 0}
+        ]
+    },
+    {
+        "id": "urban_freight",
+        "label": "Urban Freight",
+        "impact_weights": {"Economic": 0.35, "Environmental": 0.45, "Social": 0.20},
+        "sub_sliders": [
+            {"label": "Cargo Bikes", "min": 0, "max": 100, "value": 0},
+            {"label": "Consolidation", "min": 0, "max": 100, "value": 0},
+            {"label": "Restrictions", "min": 0, "max": 100, "value": 0},
+            {"label": "Fees", "min": 0, "max": 100, "value": 0}
+        ]
+    },
+    {
+        "id": "active_mobility",
+        "label": "Active Mobility",
+        "impact_weights": {"Economic": 0.25, "Environmental": 0.40, "Social": 0.35},
+        "sub_sliders": [
+            {"label": "Coverage", "min": 0, "max": 100, "value": 0},
+            {"label": "Connectivity", "min": 0, "max": 100, "value": 0},
+            {"label": "Safety", "min": 0, "max": 100, "value": 0}
+        ]
+    },
+    {
+        "id": "public_transit",
+        "label": "Public Transit",
+        "impact_weights": {"Economic": 0.20, "Environmental": 0.35, "Social": 0.45},
+        "sub_sliders": [
+            {"label": "Electrification", "min": 0, "max": 100, "value": 0},
+            {"label": "Coverage", "min": 0, "max": 100, "value": 0},
+            {"label": "Fare Subsidies", "min": 0, "max": 100, "value": 0}
+        ]
+    },
+    {
+        "id": "waste",
+        "label": "Waste Systems",
+        "impact_weights": {"Economic": 0.10, "Environmental": 0.60, "Social": 0.30},
+        "sub_sliders": [
+            {"label": "Recycling", "min": 0, "max": 100, "value": 0},
+            {"label": "Composting", "min": 0, "max": 100, "value": 0},
+            {"label": "Digestion", "min": 0, "max": 100, "value": 0}
+        ]
+    }
+]
+
+# ----------------------------------------------------------------------------
+# KPI influence matrix (H/M/L from the grid; blanks are Low)
+# ----------------------------------------------------------------------------
+
+INFLUENCE_NUM = {"none": 0.0, "L": 0.35, "M": 0.70, "H": 1.00}
+
+
+# keys: KPI name -> intervention_id -> "H"/"M"/"L"
+KPI_INFLUENCE = {
+    # ENVIRONMENTAL
+    "GHG reduction": {
+        "urban_form": "H", "building_efficiency": "H", "clean_energy": "H",
+        "urban_freight": "M", "active_mobility": "H", "public_transit": "H",
+        "waste": "M",
+    },
+    "Energy efficiency": {
+        "urban_form": "L", "building_efficiency": "H", "clean_energy": "L",
+        "urban_freight": "M", "active_mobility": "M", "public_transit": "M",
+        "waste": "M",
+    },
+    "Sustainable mode share": {
+        "urban_form": "H", "building_efficiency": "L", "clean_energy": "L",
+        "urban_freight": "L", "active_mobility": "H", "public_transit": "H",
+        "waste": "L",
+    },
+    "Waste diversion": {
+        "urban_form": "L", "building_efficiency": "L", "clean_energy": "L",
+        "urban_freight": "L", "active_mobility": "L", "public_transit": "L",
+        "waste": "H",
+    },
+
+    # ECONOMIC
+    "Household savings": {
+        "urban_form": "M", "building_efficiency": "H", "clean_energy": "L",
+        "urban_freight": "L", "active_mobility": "M", "public_transit": "M",
+        "waste": "L",
+    },
+    "Jobs created": {
+        "urban_form": "L", "building_efficiency": "H", "clean_energy": "H",
+        "urban_freight": "M", "active_mobility": "L", "public_transit": "M",
+        "waste": "M",
+    },
+    "Productivity gains": {
+        "urban_form": "M", "building_efficiency": "L", "clean_energy": "L",
+        "urban_freight": "M", "active_mobility": "H", "public_transit": "H",
+        "waste": "L",
+    },
+    "Locally-owned businesses": {
+        "urban_form": "H", "building_efficiency": "L", "clean_energy": "L",
+        "urban_freight": "M", "active_mobility": "H", "public_transit": "L",
+        "waste": "L",
+    },
+
+    # SOCIAL
+    "Housing affordability": {
+        "urban_form": "H", "building_efficiency": "H", "clean_energy": "L",
+        "urban_freight": "L", "active_mobility": "L", "public_transit": "L",
+        "waste": "L",
+    },
+    "Public health": {
+        "urban_form": "H", "building_efficiency": "L", "clean_energy": "H",
+        "urban_freight": "M", "active_mobility": "H", "public_transit": "H",
+        "waste": "M",
+    },
+    "Equity of Accessibility": {
+        "urban_form": "H", "building_efficiency": "L", "clean_energy": "L",
+        "urban_freight": "L", "active_mobility": "H", "public_transit": "H",
+        "waste": "L",
+    },
+}
+
+
+# ----------------------------------------------------------------------------
+# Derived tables (warm-loaded from .startup_cache/ when this file is unchanged)
+# ----------------------------------------------------------------------------
+
+def _build_derived_tables() -> dict:
+    ids = [it["id"] for it in INTERVENTIONS]
+    return {
+        "intervention_ids": ids,
+        # KPI name -> numeric weight per intervention, in `ids` order
+        "influence": {
+            kpi: [INFLUENCE_NUM[levels.get(iid, "none")] for iid in ids]
+            for kpi, levels in KPI_INFLUENCE.items()
+        },
+    }
+
+
+@lru_cache(maxsize=None)
+def derived_tables() -> dict:
+    key = startup.source_key(pathlib.Path(__file__).read_text(encoding="utf-8"))
+    return startup.load_artifact("model_tables", key, _build_derived_tables)
+
+
+# ============================================================================
+# MODEL FUNCTIONS
+# ============================================================================
+
+def find_city(search_text: str) -> str:
+    """Find city by search text or return first city."""
+    if not search_text:
+        return list(CITY_DATA.keys())[0]
+    search_lower = search_text.strip().lower()
+    for city in CITY_DATA:
+        if city.lower().startswith(search_lower):
+            return city
+    return list(CITY_DATA.keys())[0]
+
+
+def candidate_cities(search_text: str, limit: int = 3) -> list:
+    """Most likely matches for a partial query: prefix hits, then substring hits."""
+    search_lower = (search_text or "").strip().lower()
+    if not search_lower:
+        return list(CITY_DATA.keys())[:limit]
+    prefix = [c for c in CITY_DATA if c.lower().startswith(search_lower)]
+    inner = [c for c in CITY_DATA if search_lower in c.lower() and c not in prefix]
+    return (prefix + inner)[:limit]
+
+
+#for time series chart
+def category_improvement_from_kpis(current_vals, improved_vals, kpi_categories):
+    cats = CATEGORIES
+    out = {c: 0.0 for c in cats}
+    for c in cats:
+        cur = [cv for cv, cat in zip(current_vals, kpi_categories) if cat == c]
+        imp = [iv for iv, cat in zip(improved_vals, kpi_categories) if cat == c]
+        if not cur:
+            continue
+        cur_mean = sum(cur) / len(cur)
+        imp_mean = sum(imp) / len(imp)
+        delta = max(0.0, (imp_mean - cur_mean) / 10.0)  # 0..1
+        out[c] = min(delta, 1.0)
+    return out
+
+
+# KPI name -> MobilityResult metric that can stand in for the static lift
+MOBILITY_KPIS = {
+    "Sustainable mode share": "sustainable_share",
+    "Equity of Accessibility": "accessibility_index",
+}
+
+
+def mobility_network_source(city_key: str) -> dict:
+    """The street network `mobility_lifts` would simulate on now (see mobility_sim.network_source)."""
+    import mobility_sim
+
+    city = CITY_DATA[city_key]
+    return mobility_sim.network_source(city["map_query"], float(city.get("map_area_km", 1.5)))
+
+
+def mobility_lifts(city_key: str, intensities: dict, network_source: dict = None) -> dict:
+    """KPI name -> simulated lift (scenario metric over the no-intervention run).
+
+    `network_source` pins the streets (batch jobs); by default the city's
+    cached geometry is used once it exists.
+    """
+    import mobility_sim
+
+    city = CITY_DATA[city_key]
+    query, area = city["map_query"], float(city.get("map_area_km", 1.5))
+    baseline = mobility_sim.city_scenario(query, area, 0.0, 0.0, source=network_source)
+    scenario = mobility_sim.city_scenario(
+        query, area,
+        intensities.get("active_mobility", 0.0) / 100.0,
+        intensities.get("public_transit", 0.0) / 100.0,
+        source=network_source,
+    )
+    lifts = {}
+    for name, metric in MOBILITY_KPIS.items():
+        before = getattr(baseline, metric)
+        lifts[name] = getattr(scenario, metric) / before if before > 0 else 1.0
+    return lifts
+
+
+@lru_cache(maxsize=256)
+def improve_kpis(city_key: str, intensity_items: tuple, lift_items: tuple = ()) -> tuple:
+    """Pure, memoized KPI projection so the prefetcher can warm it off-thread.
+
+    `lift_items` ((kpi name, lift), ...), e.g. from `mobility_lifts`, replace
+    the KPI_INFLUENCE lift for those KPIs.
+    """
+    intensities = dict(intensity_items)
+    tables = derived_tables()
+    sim_lifts = dict(lift_items)
+
+    # ↑ make the radar more sensitive by increasing this
+    IMPACT_TO_LIFT = 1.40            # was 0.35
+
+    improved = []
+    for kpi in CITY_DATA[city_key]["kpis"]:
+        base = float(kpi["value"])
+        name = kpi["name"]
+
+        if name in sim_lifts:
+            improved.append(round(min(base * sim_lifts[name], 10.0), 2))
+            continue
+
+        # collect only interventions that actually influence this KPI
+        parts = []
+        max_parts = []
+        for iid, w in zip(tables["intervention_ids"], tables["influence"].get(name, ())):
+            if w > 0:
+                parts.append((intensities[iid] / 100.0) * w)
+                max_parts.append(1.0)  # this intervention could contribute up to 1.0
+
+        if not parts:
+            improved.append(base)  # no links → no change
+            continue
+
+        # optional: slightly convex response so high sliders punch more
+        total = sum((p ** 0.9) for p in parts)     # 0.9 → gentle convexity
+        max_possible = sum(max_parts)              # count ONLY linked interventions
+        normalized = min(total / max_possible, 1.0)
+
+        lift = 1.0 + normalized * IMPACT_TO_LIFT   # 0%..80% boost
+        improved.append(round(min(base * lift, 10.0), 2))
+    return tuple(improved)
+
+
+# ============================================================================
+# PROJECTIONS
+# ============================================================================
+
+def projection_time():
+    """Fractional years, one point per month across YEARS."""
+    import numpy as np
+
+    return YEARS[0] + np.arange(len(YEARS) * STEPS_PER_YEAR) / STEPS_PER_YEAR
+
+
+def project_kpis(city_key: str, intensity_items: tuple, lift_items: tuple = ()):
+    """Monthly trajectory of every KPI, shape (n_kpis, n_steps).
+
+    Each KPI eases (smoothstep) from its current value to the improved value
+    of `improve_kpis` by TARGET_YEAR and holds there afterwards.
+    """
+    import numpy as np
+
+    t = projection_time()
+    base = np.array([k["value"] for k in CITY_DATA[city_key]["kpis"]], dtype=float)
+    target = np.array(improve_kpis(city_key, intensity_items, lift_items), dtype=float)
+    ramp = np.clip((t - YEARS[0]) / (TARGET_YEAR - YEARS[0]), 0.0, 1.0)
+    ramp = ramp * ramp * (3.0 - 2.0 * ramp)
+    return t, base[:, None] + (target - base)[:, None] * ramp[None, :]
+
+
+# index series -> (CITY_DATA time_series key, direction, total range by TARGET_YEAR)
+INDEX_SERIES = {
+    "Economic": ("economy", 1.0, 40.0),
+    "Environmental": ("environment", -1.0, 50.0),
+    "Social": ("health", 1.0, 30.0),
+}
+
+
+def project_category_indices(city_key: str, cat_deltas: dict, noise_level: float = 0.10, seed=None):
+    """Monthly Economy / Environment / Health index lines, shape (3, n_steps).
+
+    Slopes are calibrated so the full range is covered by TARGET_YEAR (as the
+    original 2025–2035 annual chart did) and the trend continues after it.
+    """
+    import numpy as np
+
+    t = projection_time()
+    n = len(t)
+    ts = CITY_DATA[city_key]["time_series"]
+    keys, signs, totals = zip(*INDEX_SERIES.values())
+    starts = np.array([float(ts[k][0]) for k in keys])
+    deltas = np.array([float(cat_deltas.get(c, 0.0)) for c in INDEX_SERIES])
+    steps = np.array(signs) * np.array(totals) * deltas / (TARGET_YEAR - YEARS[0])
+
+    trend = starts[:, None] + steps[:, None] * (t - YEARS[0])[None, :]
+
+    rng = np.random.default_rng(seed)
+    amp = np.abs(steps) * 0.25 * noise_level
+    sinus = np.sin(np.linspace(0, 2 * np.pi, n))[None, :] * (amp * 0.85)[:, None]
+    rand = rng.normal(0.0, 1.0, size=(len(starts), n)) * (amp * 0.15)[:, None]
+    noisy = (deltas > 1e-12) & (noise_level > 1e-6)
+    noise = (sinus + rand) * np.where(noisy, deltas, 0.0)[:, None]
+    return t, trend + noise
@@ -0,0 +1,237 @@
+"""Local stand-in for Photon and Overpass: record real responses, replay them.
+
+    python osm_standin.py record                  # proxy upstream, save fixtures
+    python osm_standin.py replay --latency-ms 150 --bandwidth-kbps 2000
+    python osm_standin.py seed                    # fixtures from the warm city cache
+
+    URBAN_PERF_OSM_BASE=http://127.0.0.1:8765 streamlit run app.py
+
+Routes mirror the upstream APIs under a prefix:
+
+    GET  /photon/api/?q=...            -> https://photon.komoot.io/api/
+    POST /overpass/api/interpreter     -> the Overpass endpoints in geodata
+
+`geodata` (and, through the config app.py sends, the viewer) talks to
+`URBAN_PERF_OSM_BASE` instead of the public services when it is set.
+
+Fixtures live in `fixtures/osm/<service>/<key>.body` (raw response bytes)
+with a `.meta.json` next to it. The key is a hash of the normalized request.
+Photon queries are case- and whitespace-folded. Overpass queries have
+whitespace stripped and coordinates rounded to 6 decimals, so the viewer's
+and geodata's spellings of the same bbox match. Replay serves only
+fixtures; a miss is a 404, so an offline run never reaches the network.
+Latency is added before the response and bandwidth is throttled per chunk,
+so the same fixtures give the same load timings on every run.
+"""
+
+import argparse
+import hashlib
+import http.server
+import json
+import pathlib
+import re
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import geodata
+
+FIXTURES_DIR = pathlib.Path("fixtures/osm")
+CHUNK_BYTES = 16 * 1024
+
+
+# ============================================================================
+# FIXTURES
+# ============================================================================
+
+def photon_key(params: dict) -> str:
+    q = " ".join(str(params.get("q", "")).lower().split())
+    return hashlib.sha1(f"q={q}&limit={params.get('limit', '')}".encode("utf-8")).hexdigest()[:20]
+
+
+def overpass_key(query: str) -> str:
+    if query.startswith("data="):
+        query = urllib.parse.unquote_plus(query[5:])
+    query = re.sub(r"-?\d+\.\d+", lambda m: f"{float(m.group()):.6f}", query)
+    query = re.sub(r"\s+", "", query)
+    return hashlib.sha1(query.encode("utf-8")).hexdigest()[:20]
+
+
+def fixture_paths(service: str, key: str):
+    base = FIXTURES_DIR / service / key
+    return base.with_suffix(".body"), base.with_suffix(".meta.json")
+
+
+def save_fixture(service: str, key: str, body: bytes, content_type: str, request: dict) -> None:
+    body_path, meta_path = fixture_paths(service, key)
+    body_path.parent.mkdir(parents=True, exist_ok=True)
+    for path, data in (
+        (body_path, body),
+        (meta_path, json.dumps({
+            "service": service,
+            "request": request,
+            "content_type": content_type,
+            "bytes": len(body),
+            "recorded": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }, indent=2).encode("utf-8")),
+    ):
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(data)
+        tmp.replace(path)
+
+
+def load_fixture(service: str, key: str):
+    body_path, meta_path = fixture_paths(service, key)
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        return body_path.read_bytes(), meta.get("content_type", "application/json")
+    except (OSError, ValueError):
+        return None
+
+
+def seed_from_cache() -> int:
+    """Photon/Overpass fixtures for every city already in geodata's cache."""
+    written = 0
+    for query in geodata.CACHE.keys("geocode"):
+        lon, lat = geodata.CACHE.get("geocode", query)
+        body = {"type": "FeatureCollection", "features": [
+            {"type": "Feature", "geometry": {"type": "Point", "coordinates": [lon, lat]}, "properties": {}}
+        ]}
+        save_fixture("photon", photon_key({"q": query, "limit": "1"}),
+                     json.dumps(body).encode("utf-8"), "application/json", {"q": query, "limit": "1"})
+        written += 1
+    # geometry keys round the center; the viewer queries with the full-precision geocode
+    centers = {}
+    for query in geodata.CACHE.keys("geocode"):
+        center = tuple(geodata.CACHE.get("geocode", query))
+        centers[geodata.geometry_key(center, 0).rpartition(",")[0]] = center
+    for key in geodata.CACHE.keys("geometry"):
+        rounded, _, km = key.rpartition(",")
+        center = centers.get(rounded) or tuple(map(float, rounded.split(",")))
+        query = geodata.overpass_query(center, float(km))
+        body = json.dumps(geodata.CACHE.get("geometry", key), separators=(",", ":")).encode("utf-8")
+        save_fixture("overpass", overpass_key(query), body, "application/json", {"query": query})
+        written += 1
+    return written
+
+
+# ============================================================================
+# SERVER
+# ============================================================================
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    mode = "replay"
+    latency_s = 0.0
+    bandwidth_bps = None  # bytes per second; None = unthrottled
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        for start in range(0, len(body), CHUNK_BYTES):
+            chunk = body[start:start + CHUNK_BYTES]
+            self.wfile.write(chunk)
+            if self.bandwidth_bps:
+                time.sleep(len(chunk) / self.bandwidth_bps)
+
+    def _miss(self, service: str, request: dict) -> None:
+        self.log_message("no %s fixture for %s", service, json.dumps(request)[:200])
+        self._send(404, json.dumps({"error": f"no {service} fixture", "request": request}).encode("utf-8"))
+
+    def _serve(self, service: str, key: str, request: dict, fetch) -> None:
+        hit = load_fixture(service, key)
+        if hit is None and self.mode == "record":
+            try:
+                body, content_type = fetch()
+            except Exception as exc:
+                self._send(502, json.dumps({"error": str(exc)}).encode("utf-8"))
+                return
+            save_fixture(service, key, body, content_type, request)
+            hit = body, content_type
+        if hit is None:
+            self._miss(service, request)
+        else:
+            self._send(200, *hit)
+
+    def do_OPTIONS(self):
+        self.send_response(204)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
+        self.send_header("Access-Control-Allow-Headers", "Content-Type")
+        self.end_headers()
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path.rstrip("/") != geodata.STANDIN_PHOTON_PATH.rstrip("/"):
+            self._send(404, b'{"error": "unknown route"}')
+            return
+        params = dict(urllib.parse.parse_qsl(url.query))
+
+        def fetch():
+            upstream = f"{geodata.PUBLIC_PHOTON_URL}?{urllib.parse.urlencode(params)}"
+            request = urllib.request.Request(upstream, headers={"User-Agent": geodata.USER_AGENT})
+            with urllib.request.urlopen(request, timeout=geodata.REQUEST_TIMEOUT_S) as response:
+                return response.read(), response.headers.get("Content-Type", "application/json")
+
+        self._serve("photon", photon_key(params), params, fetch)
+
+    def do_POST(self):
+        if urllib.parse.urlsplit(self.path).path != geodata.STANDIN_OVERPASS_PATH:
+            self._send(404, b'{"error": "unknown route"}')
+            return
+        query = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode("utf-8")
+
+        def fetch():
+            last_err = None
+            for upstream in geodata.PUBLIC_OVERPASS_ENDPOINTS:
+                request = urllib.request.Request(
+                    upstream, data=query.encode("utf-8"),
+                    headers={"User-Agent": geodata.USER_AGENT, "Content-Type": "text/plain"},
+                )
+                try:
+                    with urllib.request.urlopen(request, timeout=geodata.REQUEST_TIMEOUT_S) as response:
+                        return response.read(), response.headers.get("Content-Type", "application/json")
+                except (OSError, urllib.error.URLError) as exc:  # try the next mirror
+                    last_err = exc
+            raise last_err or RuntimeError("Overpass failed")
+
+        self._serve("overpass", overpass_key(query), {"query": query}, fetch)
+
+
+def serve(mode: str, *, host: str = "127.0.0.1", port: int = 8765, latency_ms: float = 0.0,
+          bandwidth_kbps: float = None) -> None:
+    handler = type("Handler", (StandInHandler,), {
+        "mode": mode,
+        "latency_s": latency_ms / 1000.0,
+        "bandwidth_bps": bandwidth_kbps * 1000 / 8 if bandwidth_kbps else None,
+    })
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    print(f"{mode}ing OSM fixtures in {FIXTURES_DIR} at http://{host}:{port}")
+    print(f"    URBAN_PERF_OSM_BASE=http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record/replay stand-in for Photon and Overpass.")
+    parser.add_argument("mode", choices=("record", "replay", "seed"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="added before every response")
+    parser.add_argument("--bandwidth-kbps", type=float, default=None, help="throttle response bodies")
+    args = parser.parse_args()
+    if args.mode == "seed":
+        print(f"wrote {seed_from_cache()} fixtures to {FIXTURES_DIR}")
+        sys.exit(0)
+    serve(args.mode, host=args.host, port=args.port, latency_ms=args.latency_ms,
+          bandwidth_kbps=args.bandwidth_kbps)
@@ -0,0 +1,84 @@
+"""Background warming of city data driven by the City Search box.
+
+Each session ("owner") has at most one live generation of prefetch jobs. A new
+candidate list (i.e. new search text) bumps the generation: queued jobs are
+cancelled and running jobs stop at the next stage boundary, so the bounded
+pool only works on current candidates. The context passed along with the
+candidates (slider state) never bumps it.
+Per-owner state is an LRU of MAX_OWNERS sessions, and futures are dropped once
+they finish, so a long-lived server does not accumulate dead sessions.
+"""
+
+import collections
+import itertools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+MAX_OWNERS = 256  # sessions remembered for dedupe; the oldest are dropped
+
+
+class CityPrefetcher:
+    def __init__(self, warm_stages, max_workers: int = 2):
+        # warm_stages: callables stage(city_key, context) run in order per city
+        self._stages = list(warm_stages)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="city-prefetch")
+        self._lock = threading.Lock()
+        self._generations = itertools.count(1)
+        self._owners = collections.OrderedDict()  # owner -> (generation, last submitted city keys), LRU
+        self._futures = {}                        # owner -> list[Future], until they finish
+
+    def is_current(self, owner: str, generation: int) -> bool:
+        with self._lock:
+            state = self._owners.get(owner)
+            return state is not None and state[0] == generation
+
+    def submit(self, owner: str, city_keys, context=None) -> None:
+        """Warm `city_keys` in order; a no-op if they match the last request's keys.
+
+        `context` is handed to each stage but is not part of the match, so
+        callers can pass fast-changing state without restarting the jobs.
+        """
+        city_keys = tuple(city_keys)
+        dropped = []
+        with self._lock:
+            state = self._owners.get(owner)
+            if state is not None and state[1] == city_keys:
+                self._owners.move_to_end(owner)
+                return
+            generation = next(self._generations)
+            self._owners[owner] = (generation, city_keys)
+            self._owners.move_to_end(owner)
+            while len(self._owners) > MAX_OWNERS:
+                stale, _ = self._owners.popitem(last=False)
+                dropped += self._futures.pop(stale, [])
+            dropped += self._futures.pop(owner, [])
+            futures = self._futures[owner] = [
+                self._pool.submit(self._warm, owner, generation, city_key, context)
+                for city_key in city_keys
+            ]
+        # outside the lock: cancel() and add_done_callback() may run _reap right here
+        for future in dropped:
+            future.cancel()
+        for future in futures:
+            future.add_done_callback(lambda _, owner=owner, generation=generation: self._reap(owner, generation))
+
+    def _reap(self, owner: str, generation: int) -> None:
+        """Forget an owner's futures once its current generation is done."""
+        with self._lock:
+            state = self._owners.get(owner)
+            futures = self._futures.get(owner)
+            if state is not None and state[0] == generation and futures and all(f.done() for f in futures):
+                del self._futures[owner]
+
+    def _warm(self, owner: str, generation: int, city_key: str, context) -> None:
+        for stage in self._stages:
+            if not self.is_current(owner, generation):
+                return
+            try:
+                stage(city_key, context)
+            except Exception as exc:
+                logger.warning("prefetch of %s failed in %s: %s", city_key, stage.__name__, exc)
+                return
@@ -0,0 +1,13 @@
+"""ASGI entry point: the Streamlit app plus the viewer's telemetry endpoint.
+
+    streamlit run serve.py                  # or: uvicorn serve:app --port 8501
+
+`streamlit run app.py` still works; it just has no telemetry route, so the
+viewer does not report (see telemetry.py).
+"""
+
+import streamlit as st
+
+import telemetry
+
+app = st.App("app.py", routes=[telemetry.route()])
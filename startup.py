@@ -0,0 +1,163 @@
+"""Cold-start profiling and the warm-loadable derived-tables artifact.
+
+Profiling is opt-in:
+
+    URBAN_PERF_STARTUP_PROFILE=1 streamlit run app.py   # report after the first run
+    python startup.py [app.py]                          # one cold run, bare mode
+
+Import time is attributed per top-level package as self time (children are
+subtracted), and `span()` blocks time named initialization steps.
+"""
+
+import collections
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+PROFILE_ENV = "URBAN_PERF_STARTUP_PROFILE"
+ARTIFACT_DIR = pathlib.Path(".startup_cache")
+
+_started_at = None
+_reported = False
+_import_self_s = collections.defaultdict(float)
+_import_stack = []
+_spans = []
+
+
+def enabled() -> bool:
+    return _started_at is not None
+
+
+# ============================================================================
+# IMPORT TIMING
+# ============================================================================
+
+class _TimedLoader:
+    def __init__(self, loader, name: str):
+        self._loader = loader
+        self._name = name
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        _import_stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            total = time.perf_counter() - start
+            children = _import_stack.pop()
+            if _import_stack:
+                _import_stack[-1] += total
+            _import_self_s[self._name.partition(".")[0]] += total - children
+
+
+class _ImportTimer:
+    """Meta-path finder that wraps whichever loader the real finders return."""
+
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            find_spec = getattr(finder, "find_spec", None)
+            if finder is self or find_spec is None:
+                continue
+            spec = find_spec(name, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                spec.loader = _TimedLoader(spec.loader, name)
+            return spec
+        return None
+
+
+def begin(force: bool = False) -> None:
+    """Start profiling if requested; idempotent across Streamlit reruns."""
+    global _started_at
+    if _started_at is not None or not (force or os.environ.get(PROFILE_ENV)):
+        return
+    _started_at = time.perf_counter()
+    sys.meta_path.insert(0, _ImportTimer())
+
+
+@contextlib.contextmanager
+def span(label: str):
+    if not enabled() or _reported:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _spans.append((label, time.perf_counter() - start))
+
+
+def report(top: int = 15) -> str:
+    """Log (once) and return the startup report; empty when not profiling."""
+    global _reported
+    if not enabled() or _reported:
+        return ""
+    _reported = True
+    sys.meta_path[:] = [f for f in sys.meta_path if not isinstance(f, _ImportTimer)]
+    lines = [f"startup: {1000 * (time.perf_counter() - _started_at):.1f} ms to first run complete"]
+    lines.append("  imports (self time by top-level package):")
+    ranked = sorted(_import_self_s.items(), key=lambda kv: kv[1], reverse=True)
+    for name, seconds in ranked[:top]:
+        lines.append(f"    {1000 * seconds:8.1f} ms  {name}")
+    lines.append("  initialization:")
+    for label, seconds in _spans:
+        lines.append(f"    {1000 * seconds:8.1f} ms  {label}")
+    text = "\n".join(lines)
+    logger.warning(text)
+    return text
+
+
+# ============================================================================
+# DERIVED-TABLES ARTIFACT
+# ============================================================================
+
+def source_key(*sources) -> str:
+    raw = json.dumps(sources, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def load_artifact(name: str, key: str, build):
+    """JSON artifact `name` for `key`; rebuilt (and rewritten) when stale."""
+    path = ARTIFACT_DIR / f"{name}.json"
+    try:
+        stored = json.loads(path.read_text(encoding="utf-8"))
+        if stored.get("key") == key:
+            return stored["data"]
+    except (OSError, ValueError, KeyError):
+        pass
+    data = build()
+    try:
+        ARTIFACT_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({"key": key, "data": data}), encoding="utf-8")
+        tmp.replace(path)
+    except OSError as exc:  # read-only image: serve the freshly built tables
+        logger.warning("could not write %s: %s", path, exc)
+    return data
+
+
+if __name__ == "__main__":
+    import runpy
+
+    import startup as profiler  # the instance app.py will import, not __main__
+
+    profiler.begin(force=True)
+    with profiler.span("import streamlit"):
+        import streamlit  # noqa: F401  (streamlit run imports it before the app)
+    script = sys.argv[1] if len(sys.argv) > 1 else "app.py"
+    runpy.run_path(script, run_name="__main__")
+    print(profiler.report())
@@ -0,0 +1,242 @@
+"""Performance telemetry from the 3D city viewer, stored and aggregated.
+
+`visuals/city_test.html` posts one batch per city load: timing spans
+(geocode, fetch, parse, roads, buildings, apply, agents, total), frame-time
+percentiles over the first seconds after the scene is up, draw calls and
+triangles, and a GPU memory estimate. The viewer POSTs them to
+ENDPOINT_PATH, a plain HTTP route that `serve.py` mounts next to the
+Streamlit app, so collecting them never reruns the script; under a bare
+`streamlit run app.py` the route is absent and the viewer sends nothing.
+Rows go to a SQLite file; `summary()` aggregates them per city and area size
+and flags the ones that need a smaller `map_area_km` or precomputed geometry.
+
+    URBAN_PERF_TELEMETRY=0 streamlit run serve.py   # collection off
+    python telemetry.py report [--json]
+"""
+
+import json
+import math
+import os
+import pathlib
+import sqlite3
+import sys
+import threading
+import time
+
+TELEMETRY_ENV = "URBAN_PERF_TELEMETRY"
+DB_PATH = pathlib.Path(".telemetry/telemetry.sqlite3")
+MAX_ROWS = 50_000
+ENDPOINT_PATH = "/api/telemetry"  # user routes live outside Streamlit's reserved prefixes
+MAX_POST_BYTES = 256 * 1024
+
+SPANS = ("geocode", "fetch", "parse", "roads", "buildings", "apply", "agents", "total")
+OUTCOMES = ("ok", "cancelled", "error")
+
+# advice thresholds
+SLOW_FRAME_P95_MS = 33.0          # below ~30 fps
+HEAVY_TRIANGLES = 2_000_000
+HEAVY_GPU_MB = 512.0
+SLOW_FETCH_MS = 3000.0
+
+_lock = threading.Lock()
+_db = None
+_mounted = False  # set by route(); app.py only points the viewer at a live endpoint
+
+
+def enabled() -> bool:
+    return os.environ.get(TELEMETRY_ENV, "1") != "0"
+
+
+def viewer_config() -> dict:
+    """telemetryUrl for the viewer config, when the endpoint is mounted."""
+    return {"telemetryUrl": ENDPOINT_PATH} if _mounted and enabled() else {}
+
+
+def _conn() -> sqlite3.Connection:
+    global _db
+    if _db is None:
+        DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS loads ("
+            " id TEXT PRIMARY KEY, received REAL NOT NULL, city TEXT NOT NULL,"
+            " area_km REAL NOT NULL, outcome TEXT NOT NULL, payload TEXT NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS loads_city ON loads (city, area_km)")
+        db.execute("CREATE INDEX IF NOT EXISTS loads_received ON loads (received)")
+        _db = db
+    return _db
+
+
+def _number(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) and value >= 0 else None
+
+
+def _clean(batch: dict):
+    """Browser input: keep known fields, coerce numbers, drop anything malformed."""
+    if not isinstance(batch, dict) or not isinstance(batch.get("id"), str):
+        return None
+    city = " ".join(str(batch.get("city") or "").split())[:200]
+    area = _number(batch.get("areaKm"))
+    if not city or area is None:
+        return None
+
+    def numbers(raw, keys):
+        raw = raw if isinstance(raw, dict) else {}
+        return {k: v for k in keys if (v := _number(raw.get(k))) is not None}
+
+    return {
+        "id": batch["id"][:64],
+        "city": city,
+        "area_km": round(area, 3),
+        "outcome": batch.get("outcome") if batch.get("outcome") in OUTCOMES else "error",
+        "source": batch.get("source") if batch.get("source") in ("warm", "overpass") else None,
+        "spans": numbers(batch.get("spans"), SPANS),
+        "counts": numbers(batch.get("counts"), ("buildings", "roads", "agents")),
+        "frames": numbers(batch.get("frames"), ("n", "p50", "p95", "p99", "max")),
+        "render": numbers(batch.get("render"), ("calls", "triangles", "geometries", "textures")),
+        "gpu_mb": _number(batch.get("gpuMB")),
+        "device": numbers(batch.get("device"), ("dpr", "pixelRatio", "quality", "cores", "width", "height")),
+    }
+
+
+def ingest(batches) -> int:
+    """Store new batches (resends are ignored by id); returns how many were new."""
+    rows = [b for b in map(_clean, batches or ()) if b is not None]
+    if not rows:
+        return 0
+    now = time.time()
+    with _lock:
+        db = _conn()
+        before = db.total_changes
+        db.executemany(
+            "INSERT OR IGNORE INTO loads (id, received, city, area_km, outcome, payload) VALUES (?, ?, ?, ?, ?, ?)",
+            [(r["id"], now, r["city"], r["area_km"], r["outcome"], json.dumps(r)) for r in rows],
+        )
+        added = db.total_changes - before
+        db.execute(
+            "DELETE FROM loads WHERE id IN (SELECT id FROM loads ORDER BY received DESC LIMIT -1 OFFSET ?)",
+            (MAX_ROWS,),
+        )
+    return added
+
+
+async def _receive(request):
+    """POST {"batches": [...]} -> {"ids": [...]}; the ids ack the batches to the viewer."""
+    from starlette.concurrency import run_in_threadpool
+    from starlette.responses import JSONResponse
+
+    raw = b""
+    async for chunk in request.stream():
+        raw += chunk
+        if len(raw) > MAX_POST_BYTES:
+            return JSONResponse({"error": "too large"}, status_code=413)
+    try:
+        body = json.loads(raw)
+    except ValueError:
+        return JSONResponse({"error": "invalid JSON"}, status_code=400)
+    batches = body.get("batches") if isinstance(body, dict) else None
+    if not isinstance(batches, list):
+        return JSONResponse({"error": "expected {batches: [...]}"}, status_code=400)
+    if enabled():
+        await run_in_threadpool(ingest, batches)  # sqlite blocks; keep it off the event loop
+    return JSONResponse({"ids": [b["id"] for b in batches if isinstance(b, dict) and isinstance(b.get("id"), str)]})
+
+
+def route():
+    """Starlette route for `st.App(routes=...)` (see serve.py)."""
+    from starlette.routing import Route
+
+    global _mounted
+    _mounted = True
+    return Route(ENDPOINT_PATH, _receive, methods=["POST"])
+
+
+def _median(values):
+    values = sorted(v for v in values if v is not None)
+    return values[len(values) // 2] if values else None
+
+
+def _p95(values):
+    values = sorted(v for v in values if v is not None)
+    return values[min(len(values) - 1, int(0.95 * len(values)))] if values else None
+
+
+def summary(since_s: float = None) -> list:
+    """Per (city, area) aggregates, slowest median load first."""
+    query = "SELECT payload FROM loads"
+    args = ()
+    if since_s is not None:
+        query += " WHERE received >= ?"
+        args = (time.time() - since_s,)
+    with _lock:
+        payloads = [json.loads(row[0]) for row in _conn().execute(query, args)]
+
+    groups = {}
+    for p in payloads:
+        groups.setdefault((p["city"], p["area_km"]), []).append(p)
+
+    out = []
+    for (city, area), loads in groups.items():
+        ok = [p for p in loads if p["outcome"] == "ok"]
+        row = {
+            "city": city,
+            "area_km": area,
+            "loads": len(loads),
+            "cancelled": sum(p["outcome"] == "cancelled" for p in loads),
+            "errors": sum(p["outcome"] == "error" for p in loads),
+            "warm_share": round(sum(p.get("source") == "warm" for p in ok) / len(ok), 2) if ok else None,
+            "total_ms_p50": _median(p["spans"].get("total") for p in ok),
+            "total_ms_p95": _p95(p["spans"].get("total") for p in ok),
+            "frame_p95_ms": _median(p["frames"].get("p95") for p in ok),
+            "triangles": _median(p["render"].get("triangles") for p in ok),
+            "draw_calls": _median(p["render"].get("calls") for p in ok),
+            "gpu_mb": _median(p.get("gpu_mb") for p in ok),
+            "buildings": _median(p["counts"].get("buildings") for p in ok),
+        }
+        for span in SPANS[:-1]:
+            row[f"{span}_ms_p50"] = _median(p["spans"].get(span) for p in ok)
+        row["advice"] = _advice(row)
+        out.append(row)
+    out.sort(key=lambda r: -(r["total_ms_p50"] or 0.0))
+    return out
+
+
+def _advice(row: dict) -> list:
+    advice = []
+    heavy = (
+        (row["frame_p95_ms"] or 0) > SLOW_FRAME_P95_MS
+        or (row["triangles"] or 0) > HEAVY_TRIANGLES
+        or (row["gpu_mb"] or 0) > HEAVY_GPU_MB
+    )
+    if heavy:
+        advice.append("reduce map_area_km")
+    if (row["fetch_ms_p50"] or 0) > SLOW_FETCH_MS and (row["warm_share"] or 0) < 0.5:
+        advice.append("precompute geometry")
+    return advice
+
+
+def _fmt(value, digits=0):
+    return "-" if value is None else f"{value:,.{digits}f}"
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if not args or args[0] != "report" or set(args[1:]) - {"--json"}:
+        sys.exit("usage: python telemetry.py report [--json]")
+    rows = summary()
+    if "--json" in args:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(f"{'city':<36} {'km':>5} {'loads':>5} {'load p50':>9} {'p95':>9} {'fetch':>8} "
+              f"{'build':>8} {'frame p95':>9} {'tris':>11} {'MB':>7}  advice")
+        for r in rows:
+            print(f"{r['city'][:36]:<36} {r['area_km']:>5g} {r['loads']:>5} {_fmt(r['total_ms_p50']):>9} "
+                  f"{_fmt(r['total_ms_p95']):>9} {_fmt(r['fetch_ms_p50']):>8} {_fmt(r['buildings_ms_p50']):>8} "
+                  f"{_fmt(r['frame_p95_ms'], 1):>9} {_fmt(r['triangles']):>11} {_fmt(r['gpu_mb'], 1):>7}  "
+                  f"{', '.join(r['advice'])}")
@@ -0,0 +1,237 @@
+"""Vendored, content-hashed static assets for the 3D city viewer and chart host.
+
+    python viewer_assets.py build   # hash + pre-compress into static/viewer/
+    python viewer_assets.py fetch   # with network, after changing THREE_VERSION
+
+`build` rewrites the CDN imports in each shell (`visuals/city_test.html`,
+`visuals/chart_host.html`) and in the page-local modules they load
+(`visuals/city_worker.js`) to the hashed files, so the built pages have no
+external dependencies; plotly.js comes from the installed plotly package
+(2.28 or newer, or the chart host is skipped and charts fall back to
+st.plotly_chart).
+The pinned three.js files are committed under `visuals/vendor/` and checked
+against VENDOR_SHA256; `fetch` only re-downloads them when the pin changes.
+app.py calls `ensure_built()`, which reruns `build` whenever a source or
+vendor file is newer than the manifest. A shell whose vendor files are
+missing is skipped and the viewer falls back to unpkg; `URBAN_PERF_OFFLINE=1`
+makes that an error instead.
+
+Every file is also written as `.gz` (and `.br` when the optional `brotli`
+package is installed). Streamlit's static route serves neither those nor
+long-lived cache headers; `deploy/nginx.conf` puts nginx in front to serve
+them with gzip_static/brotli_static and
+`Cache-Control: public, max-age=31536000, immutable` (names change whenever
+content does), proxying everything else to Streamlit.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import re
+import sys
+import threading
+import urllib.request
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip siblings are written
+    brotli = None
+
+THREE_VERSION = "0.168.0"
+VENDOR_SOURCES = {
+    "three.module.js": f"https://unpkg.com/three@{THREE_VERSION}/build/three.module.js",
+    "OrbitControls.js": f"https://unpkg.com/three@{THREE_VERSION}/examples/jsm/controls/OrbitControls.js",
+}
+VENDOR_SHA256 = {
+    "three.module.js": "bdbe1d0133b5e8e02bd6299abc75338ab32e5225c0db39f4f3e76a22cbbeb156",
+    "OrbitControls.js": "80efaadea4f8a636a65fb0bd08bfef62f3d93a0bb94e2e7500f23176c5c07f4e",
+}
+# chart_transport sends {"dtype", "bdata"} typed arrays, decoded natively from plotly.js 2.28
+PLOTLY_JS_MIN = (2, 28)
+
+# page-local module -> (source, files it references); referenced as `./<name>`
+MODULES = {
+    "city_worker.js": (pathlib.Path("visuals/city_worker.js"), ("three.module.js",)),
+}
+# shell name -> (source page, vendor files and modules it references)
+SHELLS = {
+    "viewer": (
+        pathlib.Path("visuals/city_test.html"),
+        ("three.module.js", "OrbitControls.js", "city_worker.js"),
+    ),
+    "chart_host": (pathlib.Path("visuals/chart_host.html"), ("plotly.min.js",)),
+}
+VENDOR_DIR = pathlib.Path("visuals/vendor")
+BUILD_DIR = pathlib.Path("static/viewer")
+MANIFEST_PATH = BUILD_DIR / "manifest.json"
+URL_PREFIX = "app/static/viewer"
+OFFLINE_ENV = "URBAN_PERF_OFFLINE"
+
+logger = logging.getLogger(__name__)
+_build_lock = threading.Lock()
+
+
+def _hashed_name(name: str, data: bytes) -> str:
+    stem, dot, ext = name.rpartition(".")
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    return f"{stem}.{digest}.{ext}" if dot else f"{name}.{digest}"
+
+
+def _emit(path: pathlib.Path, data: bytes) -> None:
+    """Write `data` plus its pre-compressed siblings, each atomically."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    variants = {path: data, path.with_name(path.name + ".gz"): gzip.compress(data, 9, mtime=0)}
+    if brotli is not None:
+        variants[path.with_name(path.name + ".br")] = brotli.compress(data)
+    for target, blob in variants.items():
+        tmp = target.with_name(target.name + ".tmp")
+        tmp.write_bytes(blob)
+        tmp.replace(target)
+
+
+def _vendor_path(name: str) -> pathlib.Path:
+    if name == "plotly.min.js":
+        import plotly
+
+        return pathlib.Path(plotly.__file__).parent / "package_data" / name
+    return VENDOR_DIR / name
+
+
+def _plotly_js_version(path: pathlib.Path) -> tuple:
+    """(major, minor) from the bundle's `plotly.js vX.Y.Z` banner; (0, 0) if absent."""
+    with open(path, "rb") as fh:
+        match = re.search(rb"plotly\.js v(\d+)\.(\d+)", fh.read(1024))
+    return (int(match[1]), int(match[2])) if match else (0, 0)
+
+
+def fetch() -> None:
+    VENDOR_DIR.mkdir(parents=True, exist_ok=True)
+    for name, url in VENDOR_SOURCES.items():
+        with urllib.request.urlopen(url, timeout=60) as response:
+            data = response.read()
+        digest = hashlib.sha256(data).hexdigest()
+        if digest != VENDOR_SHA256[name]:
+            sys.exit(f"{url}: sha256 {digest} does not match VENDOR_SHA256; update the pin deliberately")
+        (VENDOR_DIR / name).write_bytes(data)
+        print(f"fetched {url} -> {VENDOR_DIR / name}")
+
+
+def _missing(names) -> list:
+    """Vendor files (also those of referenced modules) not on disk."""
+    missing = []
+    for name in names:
+        if name in MODULES:
+            missing += _missing(MODULES[name][1])
+        elif not _vendor_path(name).exists():
+            missing.append(name)
+        elif name == "plotly.min.js" and _plotly_js_version(_vendor_path(name)) < PLOTLY_JS_MIN:
+            missing.append(f"plotly.js >= {'.'.join(map(str, PLOTLY_JS_MIN))} (upgrade the plotly package)")
+    return missing
+
+
+def build() -> dict:
+    manifest = {"vendor": {}, "modules": {}, "shells": {}}
+
+    def link(text: str, names) -> str:
+        """Point references to `names` at their hashed outputs, emitting them once."""
+        for name in names:
+            if name in MODULES:
+                rel = manifest["modules"].get(name)
+                if rel is None:
+                    source, deps = MODULES[name]
+                    data = link(source.read_text(encoding="utf-8"), deps).encode("utf-8")
+                    rel = manifest["modules"][name] = _hashed_name(name, data)
+                    _emit(BUILD_DIR / rel, data)
+                text = text.replace(f"./{name}", f"./{rel}")
+                continue
+            rel = manifest["vendor"].get(name)
+            if rel is None:
+                data = _vendor_path(name).read_bytes()
+                rel = manifest["vendor"][name] = f"vendor/{_hashed_name(name, data)}"
+                _emit(BUILD_DIR / rel, data)
+            if name in VENDOR_SOURCES:
+                text = text.replace(VENDOR_SOURCES[name], f"./{rel}")
+            text = text.replace(f"./vendor/{name}", f"./{rel}")
+        return text
+
+    for shell_name, (source, names) in SHELLS.items():
+        missing = list(dict.fromkeys(_missing(names)))
+        if missing:
+            logger.warning("skipping %s: %s missing; run `python viewer_assets.py fetch`",
+                           shell_name, ", ".join(missing))
+            continue
+        shell_bytes = link(source.read_text(encoding="utf-8"), names).encode("utf-8")
+        manifest["shells"][shell_name] = _hashed_name(source.name, shell_bytes)
+        _emit(BUILD_DIR / manifest["shells"][shell_name], shell_bytes)
+
+    # drop stale hashed outputs from earlier builds
+    outputs = [*manifest["vendor"].values(), *manifest["modules"].values(), *manifest["shells"].values()]
+    keep = {BUILD_DIR / rel for rel in outputs}
+    for path in BUILD_DIR.rglob("*"):
+        base = path.with_name(path.name.removesuffix(".gz").removesuffix(".br"))
+        if path.is_file() and path != MANIFEST_PATH and base not in keep:
+            path.unlink()
+
+    BUILD_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = MANIFEST_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    tmp.replace(MANIFEST_PATH)
+    return manifest
+
+
+def offline() -> bool:
+    """True when shells must not fall back to CDN imports."""
+    return os.environ.get(OFFLINE_ENV, "0") == "1"
+
+
+def manifest_version():
+    """mtime of the manifest (None if unbuilt); changes on every build."""
+    try:
+        return MANIFEST_PATH.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def _inputs(names) -> list:
+    """Source and vendor files a shell is built from (those on disk)."""
+    paths = []
+    for name in names:
+        if name in MODULES:
+            paths += [MODULES[name][0], *_inputs(MODULES[name][1])]
+        elif _vendor_path(name).exists():
+            paths.append(_vendor_path(name))
+    return paths
+
+
+def ensure_built() -> None:
+    """Rebuild when any shell input is newer than the manifest."""
+    with _build_lock:
+        built = manifest_version()
+        inputs = [path for source, names in SHELLS.values() for path in (source, *_inputs(names))]
+        if built is not None and all(path.stat().st_mtime_ns <= built for path in inputs):
+            return
+        build()
+
+
+def shell_url(shell_name: str):
+    """URL of a built shell ("viewer", "chart_host"), or None if it was not built."""
+    try:
+        manifest = json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    name = manifest.get("shells", {}).get(shell_name)
+    if not name or not (BUILD_DIR / name).exists():
+        return None
+    return f"{URL_PREFIX}/{name}"
+
+
+if __name__ == "__main__":
+    commands = {"fetch": fetch, "build": build}
+    if len(sys.argv) != 2 or sys.argv[1] not in commands:
+        sys.exit("usage: python viewer_assets.py fetch|build")
+    result = commands[sys.argv[1]]()
+    if result:
+        print(json.dumps(result, indent=2))
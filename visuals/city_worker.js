@@ -0,0 +1,434 @@
+// Off-main-thread city build for city_test.html.
+//
+// Fetches and parses the OSM JSON, projects it to scene X/Z, classifies
+// buildings by road proximity, triangulates footprints and keeps the road
+// graph for routing. Geometry goes back as transferable typed arrays.
+//
+// in:  {type:'build', id, center, areaKm, heightScale, geometryUrl}
+//      {type:'route', id, count}   random building-to-building paths on the last build
+// out: {type:'progress', id, stage, done, total}
+//      {type:'built', id, roads, buildings, bbox, timings, source}
+//      {type:'routes', id, points, offsets}
+//      {type:'error', id, message}
+import { ExtrudeGeometry, Shape, Vector2 } from 'https://unpkg.com/three@0.168.0/build/three.module.js';
+
+const R = 6378137;
+const NEAR_ROAD_M = 30;
+const GRID_CELL_M = 50;
+const OVERPASS_ENDPOINTS = [
+  'https://overpass-api.de/api/interpreter',
+  'https://overpass.kumi.systems/api/interpreter'
+];
+
+// Road graph + building centroids of the last build, for 'route'
+let net = null;
+
+// Web Mercator projector -> scene X/Z (same as the page used to do)
+function llToXZ(lon, lat, originLon, originLat) {
+  const rad = Math.PI / 180;
+  const mercY  = Math.log(Math.tan(Math.PI/4 + lat * rad / 2));
+  const mercY0 = Math.log(Math.tan(Math.PI/4 + originLat * rad / 2));
+  return [R * (lon - originLon) * rad, -R * (mercY - mercY0)];
+}
+
+function progress(id, stage, done, total) {
+  self.postMessage({ type: 'progress', id, stage, done, total });
+}
+
+// ---------------------------------------------------------------------------
+// Fetching
+// ---------------------------------------------------------------------------
+
+async function fetchJson(url, init) {
+  const res = await fetch(url, init);
+  if (!res.ok) throw new Error(`HTTP ${res.status} for ${url}`);
+  return await res.json();
+}
+
+async function fetchOverpass(center, km=1.5, endpoints=OVERPASS_ENDPOINTS) {
+  const [lon, lat] = center;
+  const dLat = km / 110.574;
+  const dLon = km / (111.320 * Math.cos(lat * Math.PI / 180));
+  const minLon = lon - dLon, maxLon = lon + dLon, minLat = lat - dLat, maxLat = lat + dLat;
+
+  const query = `[
+    out:json][timeout:25];
+    (
+      way["building"](${minLat},${minLon},${maxLat},${maxLon});
+      relation["building"](${minLat},${minLon},${maxLat},${maxLon});
+    );
+    out body; >; out skel qt;
+    (
+      way["highway"]["highway"!~"footway|path|track|service"](${minLat},${minLon},${maxLat},${maxLon});
+    ); out body; >; out skel qt;`;
+
+  let lastErr;
+  for (const url of endpoints) {
+    try {
+      const ctrl = new AbortController();
+      const to = setTimeout(() => ctrl.abort(), 25000);
+      const res = await fetch(url, { method: 'POST', body: query, headers: { 'Content-Type': 'text/plain' }, signal: ctrl.signal });
+      clearTimeout(to);
+      if (res.ok) return await res.json();
+      lastErr = new Error(`Overpass HTTP ${res.status}`);
+    } catch (e) { lastErr = e; }
+  }
+  throw lastErr || new Error('Overpass failed');
+}
+
+// ---------------------------------------------------------------------------
+// Spatial grid (nearest road node, building proximity)
+// ---------------------------------------------------------------------------
+
+const cellKey = (cx, cz) => (cx + 32768) * 65536 + (cz + 32768);
+
+function makeGrid(xs, zs, cell = GRID_CELL_M) {
+  const cells = new Map();
+  let span = 0;
+  for (let i = 0; i < xs.length; i++) {
+    const cx = Math.floor(xs[i] / cell), cz = Math.floor(zs[i] / cell);
+    span = Math.max(span, Math.abs(cx), Math.abs(cz));
+    const k = cellKey(cx, cz);
+    let bucket = cells.get(k);
+    if (!bucket) cells.set(k, bucket = []);
+    bucket.push(i);
+  }
+  return { xs, zs, cell, cells, span };
+}
+
+// Index of the nearest point within maxDist, or -1. Ring r only holds points
+// at least (r - 1) * cell away, so the search stops once that exceeds the best.
+function nearest(grid, X, Z, maxDist = Infinity) {
+  const { xs, zs, cell, cells } = grid;
+  const cx = Math.floor(X / cell), cz = Math.floor(Z / cell);
+  const maxRing = grid.span + Math.max(Math.abs(cx), Math.abs(cz)) + 1;
+  let best = -1, bestD = maxDist * maxDist;
+  for (let r = 0; r <= maxRing; r++) {
+    const reach = (r - 1) * cell;
+    if (reach >= maxDist || (best >= 0 && reach * reach >= bestD)) break;
+    for (let dx = -r; dx <= r; dx++) {
+      const edge = Math.abs(dx) === r;
+      for (let dz = -r; dz <= r; dz += edge ? 1 : 2 * r) {
+        const bucket = cells.get(cellKey(cx + dx, cz + dz));
+        if (bucket) {
+          for (const i of bucket) {
+            const ddx = xs[i] - X, ddz = zs[i] - Z;
+            const d = ddx*ddx + ddz*ddz;
+            if (d < bestD) { bestD = d; best = i; }
+          }
+        }
+        if (r === 0) break;
+      }
+    }
+  }
+  return best;
+}
+
+// ---------------------------------------------------------------------------
+// Routing (CSR adjacency + binary heap; scratch arrays reused across calls)
+// ---------------------------------------------------------------------------
+
+function makeGraph(count, edgeA, edgeB, edgeCost) {
+  const start = new Int32Array(count + 1);
+  for (let e = 0; e < edgeA.length; e++) { start[edgeA[e] + 1]++; start[edgeB[e] + 1]++; }
+  for (let i = 0; i < count; i++) start[i + 1] += start[i];
+  const fill = start.slice(0, count);
+  const to = new Int32Array(start[count]);
+  const cost = new Float64Array(start[count]);
+  for (let e = 0; e < edgeA.length; e++) {
+    const a = edgeA[e], b = edgeB[e];
+    to[fill[a]] = b; cost[fill[a]++] = edgeCost[e];
+    to[fill[b]] = a; cost[fill[b]++] = edgeCost[e];
+  }
+  return {
+    start, to, cost,
+    dist: new Float64Array(count), prev: new Int32Array(count),
+    seen: new Int32Array(count), stamp: 0,
+  };
+}
+
+function dijkstra(graph, source, goal) {
+  const { start, to, cost, dist, prev, seen } = graph;
+  const stamp = ++graph.stamp;
+  const touch = (i) => { if (seen[i] !== stamp) { seen[i] = stamp; dist[i] = Infinity; prev[i] = -1; } };
+  const heapD = [], heapN = [];
+  const push = (d, n) => {
+    let i = heapD.length;
+    heapD.push(d); heapN.push(n);
+    while (i > 0) {
+      const p = (i - 1) >> 1;
+      if (heapD[p] <= d) break;
+      heapD[i] = heapD[p]; heapN[i] = heapN[p]; i = p;
+    }
+    heapD[i] = d; heapN[i] = n;
+  };
+  const pop = () => {
+    const n = heapN[0];
+    const lastD = heapD.pop(), lastN = heapN.pop();
+    if (heapD.length) {
+      let i = 0;
+      for (;;) {
+        let c = 2 * i + 1;
+        if (c >= heapD.length) break;
+        if (c + 1 < heapD.length && heapD[c + 1] < heapD[c]) c++;
+        if (heapD[c] >= lastD) break;
+        heapD[i] = heapD[c]; heapN[i] = heapN[c]; i = c;
+      }
+      heapD[i] = lastD; heapN[i] = lastN;
+    }
+    return n;
+  };
+
+  touch(source);
+  dist[source] = 0;
+  push(0, source);
+  while (heapD.length) {
+    const d = heapD[0];
+    const u = pop();
+    if (d > dist[u]) continue;
+    if (u === goal) break;
+    for (let k = start[u]; k < start[u + 1]; k++) {
+      const v = to[k];
+      touch(v);
+      const nd = d + cost[k];
+      if (nd < dist[v]) { dist[v] = nd; prev[v] = u; push(nd, v); }
+    }
+  }
+  touch(goal);
+  if (goal !== source && prev[goal] < 0) return null;
+  const path = [];
+  for (let cur = goal; cur >= 0; cur = cur === source ? -1 : prev[cur]) path.push(cur);
+  return path.reverse();
+}
+
+// ---------------------------------------------------------------------------
+// Build
+// ---------------------------------------------------------------------------
+
+function concatFloat32(chunks, total) {
+  const out = new Float32Array(total);
+  let offset = 0;
+  for (const c of chunks) { out.set(c, offset); offset += c.length; }
+  return out;
+}
+
+async function build(msg) {
+  const { id, center, areaKm, heightScale, geometryUrl, overpassEndpoints } = msg;
+
+  const timings = {};
+  let mark = performance.now();
+  const lap = (stage) => { const now = performance.now(); timings[stage] = now - mark; mark = now; };
+
+  progress(id, 'fetch', 0, 1);
+  let json = null;
+  let source = 'overpass';
+  if (geometryUrl) {
+    try { json = await fetchJson(geometryUrl); source = 'warm'; }
+    catch (err) { console.warn('Warm geometry unavailable, falling back to Overpass', err); }
+  }
+  if (!json) json = await fetchOverpass(center, areaKm, overpassEndpoints?.length ? overpassEndpoints : undefined);
+  lap('fetch');
+
+  // Parse + project every node once
+  progress(id, 'parse', 0, 1);
+  const nodeIndex = new Map();
+  const ways = [];
+  let nodeCount = 0;
+  for (const el of json.elements) {
+    if (el.type === 'node') nodeCount++;
+  }
+  const NX = new Float64Array(nodeCount), NZ = new Float64Array(nodeCount);
+  for (const el of json.elements) {
+    if (el.type === 'node') {
+      const i = nodeIndex.size;
+      nodeIndex.set(el.id, i);
+      const [X, Z] = llToXZ(el.lon, el.lat, center[0], center[1]);
+      NX[i] = X; NZ[i] = Z;
+    } else if (el.type === 'way') {
+      ways.push(el);
+    }
+  }
+  const roadWays = ways.filter(w => w.tags && w.tags.highway);
+  const buildingWays = ways.filter(w => w.tags && w.tags.building);
+  lap('parse');
+
+  // Roads: polylines + graph over road nodes
+  progress(id, 'roads', 0, roadWays.length);
+  const roadIndex = new Map(); // node index -> road node index
+  const roadX = [], roadZ = [];
+  const lineChunks = [], lineOffsets = [0];
+  let lineLength = 0;
+  const edgeA = [], edgeB = [], edgeCost = [];
+  const roadNode = (ni) => {
+    let ri = roadIndex.get(ni);
+    if (ri === undefined) {
+      ri = roadX.length;
+      roadIndex.set(ni, ri);
+      roadX.push(NX[ni]); roadZ.push(NZ[ni]);
+    }
+    return ri;
+  };
+  for (const way of roadWays) {
+    const idx = way.nodes.map(id => nodeIndex.get(id));
+    const present = idx.filter(i => i !== undefined);
+    if (present.length < 2) continue;
+    const line = new Float32Array(present.length * 3);
+    present.forEach((ni, k) => { line[k*3] = NX[ni]; line[k*3+1] = 2; line[k*3+2] = NZ[ni]; roadNode(ni); });
+    lineChunks.push(line);
+    lineLength += line.length;
+    lineOffsets.push(lineLength / 3);
+    for (let k = 0; k < idx.length - 1; k++) {
+      const a = idx[k], b = idx[k+1];
+      if (a === undefined || b === undefined) continue;
+      edgeA.push(roadIndex.get(a)); edgeB.push(roadIndex.get(b));
+      edgeCost.push(Math.hypot(NX[b] - NX[a], NZ[b] - NZ[a]));
+    }
+  }
+  const roadGrid = makeGrid(Float64Array.from(roadX), Float64Array.from(roadZ));
+  lap('roads');
+
+  // Buildings: proximity + extrusion
+  const posChunks = [], normChunks = [], uvChunks = [];
+  let vertexTotal = 0;
+  const index = [], groups = [], meta = [];
+  const centroidX = [], centroidZ = [];
+  let minX = Infinity, minY = Infinity, minZ = Infinity, maxX = -Infinity, maxY = -Infinity, maxZ = -Infinity;
+  for (let b = 0; b < buildingWays.length; b++) {
+    if (b % 250 === 0) progress(id, 'buildings', b, buildingWays.length);
+    const tags = buildingWays[b].tags;
+    const coords = buildingWays[b].nodes.map(id => nodeIndex.get(id)).filter(i => i !== undefined);
+    if (coords.length < 3) continue;
+
+    // Close polygon if needed (epsilon)
+    const first = coords[0], last = coords[coords.length - 1];
+    const isClosed = Math.hypot(NX[first] - NX[last], NZ[first] - NZ[last]) < 1e-6;
+    const pts = isClosed ? coords.slice(0, -1) : coords;
+    if (pts.length < 3) continue;
+
+    let cX = 0, cZ = 0;
+    for (const i of pts) { cX += NX[i]; cZ += NZ[i]; }
+    cX /= pts.length; cZ /= pts.length;
+
+    // --- decide tallness ---
+    const levels = parseFloat(tags.levels) || parseFloat(tags['building:levels']) || 3;
+    const nearRoad = nearest(roadGrid, cX, cZ, NEAR_ROAD_M) >= 0;   // within 30 m of any road
+    const isTall = levels > 5 && nearRoad;                           // both conditions must be true
+
+    // --- set base height ---
+    const shortHeight = 8;                      // constant for short buildings (in meters)
+    const heightTag = parseFloat(tags.height) || levels * 3.2;
+    const baseHeight = isTall ? Math.max(3, heightTag * heightScale) : shortHeight;
+
+    // Extrude the X–Z footprint (depth = -height), rotate onto the ground plane
+    let geom;
+    try {
+      const shape = new Shape(pts.map(i => new Vector2(NX[i], NZ[i])));
+      geom = new ExtrudeGeometry(shape, { depth: -baseHeight, bevelEnabled: false, steps: 1 });
+    } catch (err) {
+      continue; // degenerate footprint
+    }
+    geom.rotateX(Math.PI / 2);
+    geom.computeVertexNormals();
+
+    const pos = geom.attributes.position.array;
+    const count = pos.length / 3;
+    for (let k = 0; k < pos.length; k += 3) {
+      minX = Math.min(minX, pos[k]);   maxX = Math.max(maxX, pos[k]);
+      minY = Math.min(minY, pos[k+1]); maxY = Math.max(maxY, pos[k+1]);
+      minZ = Math.min(minZ, pos[k+2]); maxZ = Math.max(maxZ, pos[k+2]);
+    }
+    index.push(vertexTotal, count, groups.length / 3, geom.groups.length);
+    for (const g of geom.groups) groups.push(g.start, g.count, g.materialIndex);
+    meta.push(cX, cZ, baseHeight, nearRoad ? 1 : 0);
+    posChunks.push(pos);
+    normChunks.push(geom.attributes.normal.array);
+    uvChunks.push(geom.attributes.uv.array);
+    vertexTotal += count;
+    centroidX.push(cX); centroidZ.push(cZ);
+    geom.dispose();
+  }
+  progress(id, 'buildings', buildingWays.length, buildingWays.length);
+  lap('buildings');
+
+  // Camera fit box: buildings, else roads
+  let bbox = null;
+  if (meta.length) {
+    bbox = [minX, minY, minZ, maxX, maxY, maxZ];
+  } else if (roadX.length) {
+    // plain loop: spreading a large array into Math.min/max overflows the stack
+    bbox = [Infinity, 2, Infinity, -Infinity, 2, -Infinity];
+    for (let i = 0; i < roadX.length; i++) {
+      if (roadX[i] < bbox[0]) bbox[0] = roadX[i];
+      if (roadX[i] > bbox[3]) bbox[3] = roadX[i];
+      if (roadZ[i] < bbox[2]) bbox[2] = roadZ[i];
+      if (roadZ[i] > bbox[5]) bbox[5] = roadZ[i];
+    }
+  }
+
+  const roadCount = roadX.length;
+  net = {
+    graph: makeGraph(roadCount, edgeA, edgeB, edgeCost),
+    roadGrid,
+    centroidX, centroidZ,
+  };
+
+  const roads = { positions: concatFloat32(lineChunks, lineLength), offsets: Uint32Array.from(lineOffsets) };
+  const buildings = {
+    positions: concatFloat32(posChunks, vertexTotal * 3),
+    normals: concatFloat32(normChunks, vertexTotal * 3),
+    uvs: concatFloat32(uvChunks, vertexTotal * 2),
+    index: Uint32Array.from(index),
+    groups: Uint32Array.from(groups),
+    meta: Float32Array.from(meta),
+  };
+  const transfer = [roads.positions, roads.offsets, ...Object.values(buildings)].map(a => a.buffer);
+  return { result: { type: 'built', id, roads, buildings, bbox, timings, source }, transfer };
+}
+
+function route(msg) {
+  const { id, count } = msg;
+  const points = [], offsets = [0];
+  if (net && net.centroidX.length >= 2 && net.roadGrid.xs.length >= 2) {
+    const { graph, roadGrid, centroidX, centroidZ } = net;
+    for (let i = 0; i < count; i++) {
+      const o = Math.floor(Math.random() * centroidX.length);
+      const d = Math.floor(Math.random() * centroidX.length);
+      const oNode = nearest(roadGrid, centroidX[o], centroidZ[o]);
+      const dNode = nearest(roadGrid, centroidX[d], centroidZ[d]);
+      if (oNode < 0 || dNode < 0) continue;
+      const path = dijkstra(graph, oNode, dNode);
+      if (!path || path.length < 2) continue;
+      for (const n of path) points.push(roadGrid.xs[n], roadGrid.zs[n]);
+      offsets.push(points.length / 2);
+    }
+  }
+  const result = { type: 'routes', id, points: Float32Array.from(points), offsets: Uint32Array.from(offsets) };
+  return { result, transfer: [result.points.buffer, result.offsets.buffer] };
+}
+
+self.onmessage = async (event) => {
+  const msg = event.data;
+  try {
+    const handler = msg.type === 'build' ? build : msg.type === 'route' ? route : null;
+    if (!handler) return;
+    const { result, transfer } = await handler(msg);
+    self.postMessage(result, transfer);
+  } catch (err) {
+    self.postMessage({ type: 'error', id: msg.id, message: String((err && err.message) || err) });
+  }
+};
+
+// Lightweight tests
+(function runTests(){
+  try {
+    const g = makeGraph(3, [0, 1, 0], [1, 2, 2], [1, 2, 5]);
+    const path = dijkstra(g, 0, 2);
+    console.assert(Array.isArray(path) && path.join('-') === '0-1-2', 'Dijkstra test failed', path);
+    const a = llToXZ(0, 0, 0, 0), b = llToXZ(0.001, 0, 0, 0);
+    console.assert(a[0] === 0 && a[1] === 0, 'llToXZ origin failed');
+    console.assert(b[0] > 0, 'llToXZ east should increase X');
+    const grid = makeGrid(Float64Array.from([0, 100, 260]), Float64Array.from([0, 0, 0]));
+    console.assert(nearest(grid, 240, 10) === 2 && nearest(grid, 180, 0, 30) === -1, 'nearest test failed');
+    console.debug('[Worker tests] Passed');
+  } catch (e) { console.error('[Worker tests] Failed', e); }
+})();